@@ -0,0 +1,259 @@
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import wraps
+from flask import current_app, request, jsonify
+
+# SQLite allows one writer at a time. Write requests queue here, in their worker
+# process, instead of all piling onto the database lock.
+WRITER_SLOTS = 1
+MAX_QUEUE = 64
+PER_TENANT_LIMIT = 4
+MAX_WAIT = 10.0
+BUSY_RETRIES = 4
+BUSY_BACKOFF = 0.05
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+class Overloaded(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+class _Ticket:
+    __slots__ = ('tenant', 'granted', 'evicted')
+
+    def __init__(self, tenant):
+        self.tenant = tenant
+        self.granted = False
+        self.evicted = False
+
+class AdmissionController:
+    """Bounded, tenant-fair wait queue in front of a fixed number of writer slots.
+
+    Each tenant (church) has its own FIFO queue and free slots are handed out
+    round-robin across tenants, so one busy branch cannot starve the others.
+    A tenant holds at most per_tenant_limit slots at once; anything beyond
+    that waits in the queue. Requests are only shed when the queue is full,
+    and then a tenant within its limit takes the place of the newest request
+    of the tenant with the most writes in flight.
+    """
+
+    def __init__(self, slots=WRITER_SLOTS, max_queue=MAX_QUEUE, per_tenant_limit=PER_TENANT_LIMIT, max_wait=MAX_WAIT):
+        self.slots = slots
+        self.max_queue = max_queue
+        self.per_tenant_limit = per_tenant_limit
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queues = OrderedDict()
+        self._queued = 0
+        # Slots held per tenant, and slots held plus queue entries per tenant
+        self._tenant_active = {}
+        self._tenant_load = {}
+        self._stats = {
+            'admitted': 0,
+            'rejected': 0,
+            'evicted': 0,
+            'timed_out': 0,
+            'busy_retries': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0
+        }
+
+    def acquire(self, tenant):
+        # Blocks until a slot is free; returns the seconds spent waiting or raises Overloaded
+        start = time.monotonic()
+        with self._cond:
+            if self._active < self.slots and not self._queued and self._tenant_active.get(tenant, 0) < self.per_tenant_limit:
+                self._admit(tenant, 0.0)
+                return 0.0
+            if self._queued >= self.max_queue and not self._evict_for(tenant):
+                self._stats['rejected'] += 1
+                raise Overloaded('Write queue is full', self._retry_after())
+
+            ticket = _Ticket(tenant)
+            self._queues.setdefault(tenant, deque()).append(ticket)
+            self._queued += 1
+            self._tenant_load[tenant] = self._tenant_load.get(tenant, 0) + 1
+
+            deadline = start + self.max_wait
+            while not ticket.granted:
+                if ticket.evicted:
+                    raise Overloaded('Write queue is full', self._retry_after())
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._dequeue(ticket)
+                    self._stats['timed_out'] += 1
+                    raise Overloaded('Timed out waiting for the database', self._retry_after())
+                self._cond.wait(remaining)
+
+            waited = time.monotonic() - start
+            self._record_wait(waited)
+            return waited
+
+    def release(self, tenant):
+        with self._cond:
+            self._active -= 1
+            self._drop(self._tenant_active, tenant)
+            self._drop(self._tenant_load, tenant)
+            self._grant_next()
+
+    def record_busy_retry(self):
+        with self._cond:
+            self._stats['busy_retries'] += 1
+
+    def metrics(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'active': self._active,
+                'queue_depth': self._queued,
+                'queued_tenants': sum(1 for q in self._queues.values() if q),
+                'slots': self.slots,
+                'max_queue': self.max_queue,
+                'per_tenant_limit': self.per_tenant_limit
+            })
+        admitted = stats['admitted']
+        stats['wait_seconds_avg'] = stats['wait_seconds_total'] / admitted if admitted else 0.0
+        return stats
+
+    # The helpers below expect self._cond to be held
+
+    def _admit(self, tenant, waited):
+        self._active += 1
+        self._tenant_active[tenant] = self._tenant_active.get(tenant, 0) + 1
+        self._tenant_load[tenant] = self._tenant_load.get(tenant, 0) + 1
+        self._record_wait(waited)
+
+    def _record_wait(self, waited):
+        self._stats['admitted'] += 1
+        self._stats['wait_seconds_total'] += waited
+        self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+
+    def _grant_next(self):
+        while self._active < self.slots and self._queued:
+            # Round-robin: serve the first tenant with a waiting request and a
+            # free share of the slots, then move it to the back
+            for tenant, tickets in self._queues.items():
+                if self._tenant_active.get(tenant, 0) < self.per_tenant_limit:
+                    break
+            else:
+                break
+            ticket = tickets.popleft()
+            self._queues.move_to_end(tenant)
+            if not tickets:
+                del self._queues[tenant]
+            self._queued -= 1
+            self._active += 1
+            self._tenant_active[tenant] = self._tenant_active.get(tenant, 0) + 1
+            ticket.granted = True
+        self._cond.notify_all()
+
+    def _evict_for(self, tenant):
+        # Make room in a full queue for tenant by shedding the newest request of
+        # the tenant with the most writes in flight, if that one is over its limit
+        if self._tenant_load.get(tenant, 0) >= self.per_tenant_limit:
+            return False
+        load, heaviest = max((self._tenant_load.get(t, 0), t) for t in self._queues)
+        if load <= self.per_tenant_limit:
+            return False
+        ticket = self._queues[heaviest].pop()
+        if not self._queues[heaviest]:
+            del self._queues[heaviest]
+        self._queued -= 1
+        self._drop(self._tenant_load, heaviest)
+        ticket.evicted = True
+        self._stats['evicted'] += 1
+        self._cond.notify_all()
+        return True
+
+    def _dequeue(self, ticket):
+        tickets = self._queues.get(ticket.tenant)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._queues[ticket.tenant]
+            self._queued -= 1
+            self._drop(self._tenant_load, ticket.tenant)
+
+    def _drop(self, counts, tenant):
+        count = counts.get(tenant, 0) - 1
+        if count > 0:
+            counts[tenant] = count
+        else:
+            counts.pop(tenant, None)
+
+    def _retry_after(self):
+        # Rough estimate in whole seconds of how long the current backlog takes to drain
+        return max(1, int(self._queued / max(self.slots, 1) * 0.1) + 1)
+
+_controllers_lock = threading.Lock()
+
+def controller_for(app=None):
+    """The admission controller of app (default: the current app).
+
+    Every app has its own, so separate app instances don't share writer
+    slots, tenant limits or metrics. Limits come from the app's WRITER_SLOTS,
+    WRITE_QUEUE_SIZE, PER_TENANT_WRITE_LIMIT and WRITE_MAX_WAIT settings if set.
+    """
+    app = app or current_app._get_current_object()
+    controller = app.extensions.get('admission')
+    if controller is None:
+        with _controllers_lock:
+            controller = app.extensions.get('admission')
+            if controller is None:
+                controller = app.extensions['admission'] = AdmissionController(
+                    slots=app.config.get('WRITER_SLOTS', WRITER_SLOTS),
+                    max_queue=app.config.get('WRITE_QUEUE_SIZE', MAX_QUEUE),
+                    per_tenant_limit=app.config.get('PER_TENANT_WRITE_LIMIT', PER_TENANT_LIMIT),
+                    max_wait=app.config.get('WRITE_MAX_WAIT', MAX_WAIT))
+    return controller
+
+def _is_busy(response):
+    # Handlers turn every exception into a 500 {'error': str(e)}; recognize SQLITE_BUSY in it
+    if response.status_code != 500:
+        return False
+    body = response.get_json(silent=True) or {}
+    error = str(body.get('error', ''))
+    return 'database is locked' in error or 'database is busy' in error
+
+def overloaded_response(reason, retry_after):
+    response = jsonify({'error': reason})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def admit_writes(view):
+    """Route decorator: run non-GET requests through the admission controller.
+
+    Requests rejected by the queue, and writes that still hit SQLITE_BUSY
+    after jittered retries, get a 503 with Retry-After instead of a 500.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method in READ_METHODS:
+            return view(*args, **kwargs)
+
+        controller = controller_for()
+        tenant = request.headers.get('Associated-Church-Id') or request.remote_addr
+        try:
+            controller.acquire(tenant)
+        except Overloaded as e:
+            return overloaded_response(str(e), e.retry_after)
+
+        try:
+            for attempt in range(BUSY_RETRIES + 1):
+                response = current_app.make_response(view(*args, **kwargs))
+                if not _is_busy(response):
+                    return response
+                if attempt < BUSY_RETRIES:
+                    controller.record_busy_retry()
+                    # Exponential backoff with full jitter
+                    time.sleep(random.uniform(0, BUSY_BACKOFF * (2 ** attempt)))
+            return overloaded_response('Database is busy, please retry', 1)
+        finally:
+            controller.release(tenant)
+
+    return wrapper
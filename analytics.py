@@ -0,0 +1,240 @@
+import numpy as np
+
+# numpy's epoch (1970-01-01) is a Thursday, shift by 3 days to land on Mondays
+_MONDAY_OFFSET = 3
+
+def _day_or_nat(value):
+    try:
+        return np.datetime64(value, 'D')
+    except ValueError:
+        return np.datetime64('NaT', 'D')
+
+def days(values):
+    """datetime64[D] of 'YYYY-MM-DD' strings, NaT where a value isn't a date.
+
+    Stored dates aren't validated, so 'soon' or '2025-13-01' can turn up;
+    NumPy rejects the whole array for one of those, in which case the
+    distinct values are parsed one by one.
+    """
+    try:
+        return np.array(values, dtype='datetime64[D]')
+    except ValueError:
+        distinct, inverse = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+        return np.array([_day_or_nat(value) for value in distinct], dtype='datetime64[D]')[inverse]
+
+def dated(rows, index):
+    """The rows whose value at index is a date, and those dates (datetime64[D])."""
+    values = days([row[index] for row in rows])
+    valid = ~np.isnat(values)
+    if valid.all():
+        return rows, values
+    return [row for row, ok in zip(rows, valid.tolist()) if ok], values[valid]
+
+def week_starts(dates):
+    # Map datetime64[D] dates to the Monday of their week
+    offset = (dates.astype(np.int64) + _MONDAY_OFFSET) % 7
+    return dates - offset.astype('timedelta64[D]')
+
+def weekly_matrix(group_keys, dates, values):
+    """Sum values into a dense (group x week) matrix.
+
+    dates are datetime64[D]. Returns the sorted unique group keys, the week
+    start dates and the matrix. Weeks without data are kept as zero columns
+    so every row shares the same calendar.
+    """
+    keys, group_idx = np.unique(np.asarray(group_keys), return_inverse=True)
+    starts = week_starts(dates)
+
+    first_week = starts.min()
+    week_idx = ((starts - first_week) // np.timedelta64(7, 'D')).astype(np.int64)
+    n_weeks = int(week_idx.max()) + 1
+
+    flat = group_idx * n_weeks + week_idx
+    totals = np.bincount(flat, weights=np.asarray(values, dtype=np.float64),
+                         minlength=len(keys) * n_weeks).reshape(len(keys), n_weeks)
+    calendar = first_week + np.arange(n_weeks) * np.timedelta64(7, 'D')
+    return keys, calendar, totals
+
+def rolling_mean(matrix, window):
+    # Trailing mean along each row; the first window-1 columns average what is available
+    csum = np.cumsum(matrix, axis=1)
+    shifted = np.zeros_like(csum)
+    if window < matrix.shape[1]:
+        shifted[:, window:] = csum[:, :-window]
+    counts = np.minimum(np.arange(1, matrix.shape[1] + 1), window)
+    return (csum - shifted) / counts
+
+def growth_rates(matrix):
+    # Period-over-period growth; NaN for the first column and where the previous value is 0
+    rates = np.full(matrix.shape, np.nan)
+    prev = matrix[:, :-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates[:, 1:] = np.where(prev != 0, (matrix[:, 1:] - prev) / prev, np.nan)
+    return rates
+
+def to_list(values, decimals=4):
+    # JSON friendly (nested) list: rounded floats, NaN becomes None
+    rounded = np.round(np.asarray(values, dtype=np.float64), decimals)
+    result = rounded.astype(object)
+    result[np.isnan(rounded)] = None
+    return result.tolist()
+
+def pivot_totals(row_keys, col_keys, values, rows=None):
+    """Sum and count values per (row key, column key) pair.
+
+    Row positions follow rows if given (sorted keys), otherwise the sorted
+    unique row keys. Returns the row keys, column keys, sums and counts.
+    """
+    if rows is None:
+        rows = np.unique(np.asarray(row_keys))
+    cols, col_idx = np.unique(np.asarray(col_keys), return_inverse=True)
+    row_idx = np.searchsorted(rows, np.asarray(row_keys))
+
+    flat = row_idx * len(cols) + col_idx
+    size = len(rows) * len(cols)
+    sums = np.bincount(flat, weights=np.asarray(values, dtype=np.float64), minlength=size)
+    counts = np.bincount(flat, minlength=size)
+    return rows, cols, sums.reshape(len(rows), len(cols)), counts.reshape(len(rows), len(cols))
+
+# --- Forecasting ---
+
+# Row layouts of the donations and expenses loaded for a forecast; ids that
+# may be NULL are selected as -1
+DONATION_FIELDS = [('church_id', np.int64), ('date', 'datetime64[D]'), ('amount', np.float64)]
+EXPENSE_FIELDS = [('church_id', np.int64), ('project_id', np.int64), ('date', 'datetime64[D]'), ('amount', np.float64)]
+
+def records(rows, fields):
+    """Structured array of rows (tuples with one value per field).
+
+    NumPy parses the 'YYYY-MM-DD' dates while building the array, which is
+    several times faster than transposing the rows and converting columns.
+    Rows whose date isn't one are left out.
+    """
+    try:
+        table = np.array(rows, dtype=fields)
+    except ValueError:
+        # Build it with the dates as text and parse those on their own
+        raw = np.array(rows, dtype=[(name, object if dtype == 'datetime64[D]' else dtype) for name, dtype in fields])
+        table = np.empty(len(raw), dtype=fields)
+        for name, dtype in fields:
+            table[name] = days(raw[name]) if dtype == 'datetime64[D]' else raw[name]
+    valid = np.ones(len(table), dtype=bool)
+    for name, dtype in fields:
+        if dtype == 'datetime64[D]':
+            valid &= ~np.isnat(table[name])
+    return table if valid.all() else table[valid]
+
+def weeks_before(days, as_of):
+    """Whole weeks from each day back to as_of (both datetime64[D]).
+
+    0 is the 7 days ending at as_of, 1 the 7 days before that, and so on, so
+    every bucket is a full week however far into the calendar week as_of is.
+    """
+    return ((as_of - days) // np.timedelta64(7, 'D')).astype(np.int64)
+
+def series_matrix(series_idx, ages, values, n_series, min_weeks=1):
+    """Sum values into a dense (series x week) matrix, oldest week first.
+
+    ages are weeks_before() values, so the last column is the week ending at
+    as_of. Every series spans the full history, and at least min_weeks.
+    """
+    ages = np.asarray(ages, dtype=np.int64)
+    n_weeks = max(int(ages.max()) + 1 if len(ages) else 0, min_weeks)
+    flat = np.asarray(series_idx, dtype=np.int64) * n_weeks + (n_weeks - 1 - ages)
+    totals = np.bincount(flat, weights=np.asarray(values, dtype=np.float64), minlength=n_series * n_weeks)
+    return totals.reshape(n_series, n_weeks)
+
+def exhaustion_dates(remaining, rate, as_of):
+    """When remaining runs out at rate per week, counting from as_of.
+
+    Returns the dates (NaT where rate is not positive, as_of where nothing is
+    left) and the weeks left (NaN where it never runs out).
+    """
+    remaining = np.asarray(remaining, dtype=np.float64)
+    rate = np.asarray(rate, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weeks_left = np.where(rate > 0, np.maximum(remaining, 0) / rate, np.nan)
+    dates = np.full(len(weeks_left), np.datetime64('NaT'), dtype='datetime64[D]')
+    runs_out = ~np.isnan(weeks_left)
+    dates[runs_out] = as_of + np.round(weeks_left[runs_out] * 7).astype(np.int64).astype('timedelta64[D]')
+    return dates, weeks_left
+
+def positions(keys, values):
+    # Index of each value in the sorted array keys, -1 where it isn't there
+    keys = np.asarray(keys, dtype=np.int64)
+    values = np.asarray(values, dtype=np.int64)
+    if not len(keys):
+        return np.full(len(values), -1, dtype=np.int64)
+    idx = np.minimum(np.searchsorted(keys, values), len(keys) - 1)
+    return np.where(keys[idx] == values, idx, -1)
+
+def finance_forecast(church_keys, project_keys, budgets, donations, expenses, as_of, window, horizon):
+    """Burn rates, moving averages and exhaustion dates for churches and projects.
+
+    church_keys and project_keys are sorted ids, budgets the project budgets
+    in the same order, donations and expenses records() of everything up to
+    as_of. Donations and expenses per church and expenses per project are
+    stacked into one (series x week) matrix, so every rate and average comes
+    out of the same few array operations however many branches there are.
+    Rates are the trailing window-week mean per week; balances are projected
+    horizon weeks ahead.
+    """
+    n_churches, n_projects = len(church_keys), len(project_keys)
+
+    e_ages = weeks_before(expenses['date'], as_of)
+    e_amounts = expenses['amount']
+    project_idx = positions(project_keys, expenses['project_id'])
+    on_project = project_idx >= 0
+
+    # Rows: donations per church, expenses per church, expenses per project
+    series_idx = np.concatenate([
+        positions(church_keys, donations['church_id']),
+        n_churches + positions(church_keys, expenses['church_id']),
+        2 * n_churches + project_idx[on_project]
+    ])
+    ages = np.concatenate([weeks_before(donations['date'], as_of), e_ages, e_ages[on_project]])
+    values = np.concatenate([donations['amount'], e_amounts, e_amounts[on_project]])
+    matrix = series_matrix(series_idx, ages, values, 2 * n_churches + n_projects, min_weeks=window)
+
+    totals = matrix.sum(axis=1)
+    averages = rolling_mean(matrix, window)
+    rates = averages[:, -1]
+    donations_rows, expenses_rows, projects_rows = slice(0, n_churches), slice(n_churches, 2 * n_churches), slice(2 * n_churches, None)
+
+    balance = totals[donations_rows] - totals[expenses_rows]
+    net_rate = rates[donations_rows] - rates[expenses_rows]
+    balance_exhaustion, _ = exhaustion_dates(balance, -net_rate, as_of)
+
+    spent = totals[projects_rows]
+    remaining = np.asarray(budgets, dtype=np.float64) - spent
+    budget_exhaustion, weeks_left = exhaustion_dates(remaining, rates[projects_rows], as_of)
+
+    n_weeks = matrix.shape[1]
+    return {
+        # End date of every week, the last one being as_of
+        'calendar': as_of - (n_weeks - 1 - np.arange(n_weeks)) * np.timedelta64(7, 'D'),
+        'donation_average': averages[donations_rows],
+        'expense_average': averages[expenses_rows],
+        'donation_rate': rates[donations_rows],
+        'expense_rate': rates[expenses_rows],
+        'balance': balance,
+        'projected_balance': balance + net_rate * horizon,
+        'balance_exhaustion': balance_exhaustion,
+        'spending_average': averages[projects_rows],
+        'burn_rate': rates[projects_rows],
+        'spent': spent,
+        'remaining': remaining,
+        'weeks_left': weeks_left,
+        'budget_exhaustion': budget_exhaustion
+    }
+
+def day(value=None):
+    # datetime64[D] of a 'YYYY-MM-DD' string, today (UTC) by default; raises ValueError
+    return np.datetime64(value or 'today', 'D')
+
+def to_dates(values):
+    # JSON friendly list of ISO dates, NaT becomes None
+    values = np.asarray(values, dtype='datetime64[D]')
+    result = values.astype(str).astype(object)
+    result[np.isnat(values)] = None
+    return result.tolist()
@@ -1,25 +1,208 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, g
+import os
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
-
-app = Flask(__name__)
+import threading
+import analytics
+import data_access
+import database
+import serialization
+import admission
+import passwords
+import reports
+import jobs
+
+bp = Blueprint('api', __name__)
+
+DEFAULT_CONFIG = {
+    # File path, 'file:' URI, ':memory:' or ':temp:' (see data_access.Storage)
+    'DATABASE': database.default_path(),
+    # Cached /attendance/analytics results per app
+    'ATTENDANCE_ANALYTICS_CACHE_SIZE': 256,
+    # Password hashing processes per app and worker process; 0 hashes inline
+    'PASSWORD_HASH_WORKERS': passwords.HASH_WORKERS,
+    # Report job records and cached results (see jobs.JobQueue); by default
+    # next to the database file, e.g. database.db-jobs
+    'JOB_DIR': os.environ.get('JOB_DIR'),
+    'JOB_WORKERS': int(os.environ.get('JOB_WORKERS', jobs.WORKERS))
+}
+
+def create_app(config=None):
+    """Create the API app. Nothing touches the database until the first
+    connection, which also creates the schema if the database is empty."""
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    if config:
+        app.config.update(config)
+    app.register_blueprint(bp)
+    return app
+
+def dispose_app(app):
+    # Close pooled connections and drop in-memory/temporary storage
+    state = app.extensions.pop('church_api', None)
+    if state is not None:
+        if state.pool is not None:
+            state.pool.clear()
+        if state.jobs is not None:
+            state.jobs.shutdown()
+        if state.hash_pool is not None:
+            state.hash_pool.shutdown()
+        state.storage.close()
+
+# `gunicorn app:app` and `from app import app` still work; the default app is
+# only created when first asked for
+_default_app = None
+
+def __getattr__(name):
+    global _default_app
+    if name == 'app':
+        with _state_lock:
+            if _default_app is None:
+                _default_app = create_app()
+        return _default_app
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+class _AppState:
+    # Database and cache state of one app, kept in app.extensions
+    def __init__(self, config):
+        self.storage = data_access.Storage(config['DATABASE'])
+        self.pool = None
+        self.jobs = None
+        self.hash_pool = None
+        self.schema_ready = False
+        # Set while no warmup is running; /health reports not ready until it is
+        self.warm = threading.Event()
+        self.warm.set()
+        self.attendance_analytics_cache = {}
+
+_state_lock = threading.RLock()
+
+def _state(app=None):
+    app = app or current_app._get_current_object()
+    state = app.extensions.get('church_api')
+    if state is None:
+        with _state_lock:
+            state = app.extensions.get('church_api')
+            if state is None:
+                state = app.extensions['church_api'] = _AppState(app.config)
+    return state
+
+class _SharedConnection(sqlite3.Connection):
+    # Connection handed to every sub-request of a /batch call. Handlers close
+    # their connection when done, so close() is a no-op until the batch ends.
+    def close(self):
+        pass
+
+    def release(self):
+        super().close()
+
+def _get_pool(state):
+    # A forked worker must not reuse its parent's connections
+    if state.pool is None or state.pool.pid != os.getpid():
+        state.pool = data_access.ConnectionPool(state.storage)
+    return state.pool
+
+def _get_jobs(app=None):
+    # Report jobs run on threads of this process, like the connection pool
+    app = app or current_app._get_current_object()
+    state = _state(app)
+    with _state_lock:
+        if state.jobs is None or state.jobs.pid != os.getpid():
+            directory = app.config['JOB_DIR'] or state.storage.sidecar_dir('-jobs')
+            state.jobs = jobs.JobQueue(directory, lambda: connect_db(app=app), workers=app.config['JOB_WORKERS'])
+    return state.jobs
+
+def _hash_pool(app=None):
+    # Password hashing processes of this app, started per process like the other pools
+    app = app or current_app._get_current_object()
+    state = _state(app)
+    with _state_lock:
+        if state.hash_pool is None or state.hash_pool.pid != os.getpid():
+            state.hash_pool = passwords.HashPool(app.config['PASSWORD_HASH_WORKERS'])
+    return state.hash_pool
+
+# Pooled connection by default, or a dedicated one of the given class
+def connect_db(factory=None, app=None):
+    state = _state(app)
+    if factory is None:
+        conn = _get_pool(state).acquire()
+    else:
+        conn = state.storage.connect(factory=factory)
+    if not state.schema_ready:
+        with _state_lock:
+            if not state.schema_ready:
+                database.ensure_schema(conn)
+                state.schema_ready = True
+    return conn
+
+# Returns the connection handlers should use for the current request
+def get_db():
+    shared_conn = g.get('shared_conn')
+    if shared_conn is not None:
+        return shared_conn
+    return connect_db()
+
+# --- Worker Startup ---
+
+def warmup(app):
+    # Fill the connection pool and prepare each connection's statements; the
+    # first one also reads the database into the OS page cache
+    state = _state(app)
+    pool = _get_pool(state)
+    conns = [connect_db(app=app) for _ in range(pool.size)]
+    try:
+        for i, conn in enumerate(conns):
+            data_access.warm_connection(conn, scan=i == 0)
+    finally:
+        for conn in conns:
+            conn.close()
+        state.warm.set()
+
+def init_worker(app):
+    # Per-process state must not be inherited from the preloading parent
+    state = _state(app)
+    state.pool = None
+    state.jobs = None
+    state.hash_pool = None
+    state.attendance_analytics_cache.clear()
+    state.warm.clear()
+    threading.Thread(target=warmup, args=(app,), name='warmup', daemon=True).start()
 
 # Health check endpoint
-@app.route('/health', methods=['GET'])
+@bp.route('/health', methods=['GET'])
 def health():
+    if not _state().warm.is_set():
+        return jsonify({'status': 'warming_up'}), 503
     return jsonify({'status': 'ok'}), 200
 
+# Runtime metrics for this worker process
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        'pid': os.getpid(),
+        'admission': admission.controller_for().metrics(),
+        'password_hashing': passwords.metrics(_hash_pool()),
+        'report_jobs': _get_jobs().metrics()
+    }), 200
+
 # User registration
-@app.route('/register', methods=['POST'])
+@bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
     church_name = data['church_name']
     email = data['email']
     password = data['password']
 
-    hashed_password = generate_password_hash(password)
+    # Hash before queueing for the writer slot; retries reuse the hash
+    try:
+        hashed_password = passwords.hash_password(password, _hash_pool())
+    except passwords.HashQueueFull as e:
+        return admission.overloaded_response(str(e), 1)
+
+    return _register_main_church(church_name, email, hashed_password)
 
-    conn = sqlite3.connect('database.db')
+@admission.admit_writes
+def _register_main_church(church_name, email, hashed_password):
+    conn = get_db()
     # Enable foreign key support
     conn.execute('PRAGMA foreign_keys = ON;')
     c = conn.cursor()
@@ -46,7 +229,8 @@ def register():
         conn.close()
 
 # Endpoint to create a new branch church (by main_church user)
-@app.route('/churches', methods=['POST'])
+@bp.route('/churches', methods=['POST'])
+@admission.admit_writes
 def create_church():
     # Rudimentary Authorization: Check user_id and user_role from headers
     user_id = request.headers.get('User-Id')
@@ -65,7 +249,7 @@ def create_church():
     if not church_name:
         return jsonify({'error': 'Church name is required!'}), 400
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     conn.execute('PRAGMA foreign_keys = ON;')
     c = conn.cursor()
 
@@ -85,7 +269,7 @@ def create_church():
         conn.close()
 
 # Endpoint to get all branch churches for a main church (by main_church user)
-@app.route('/churches', methods=['GET'])
+@bp.route('/churches', methods=['GET'])
 def get_churches():
     user_id = request.headers.get('User-Id')
     user_role = request.headers.get('User-Role')
@@ -97,7 +281,7 @@ def get_churches():
     if user_role != 'main_church':
         return jsonify({'error': 'Only main church users can view branches!'}), 403
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     conn.execute('PRAGMA foreign_keys = ON;')
     c = conn.cursor()
 
@@ -117,7 +301,7 @@ def get_churches():
         conn.close()
 
 # Endpoint to create a branch admin (by main_church user)
-@app.route('/users', methods=['POST'])
+@bp.route('/users', methods=['POST'])
 def create_user():
     # Authorization: Check user_id and user_role from headers
     main_church_user_id = request.headers.get('User-Id')
@@ -138,8 +322,7 @@ def create_user():
     if not email or not password or not branch_church_id:
         return jsonify({'error': 'Email, password, and branch_church_id are required!'}), 400
 
-    conn = sqlite3.connect('database.db')
-    conn.execute('PRAGMA foreign_keys = ON;')
+    conn = get_db()
     c = conn.cursor()
 
     try:
@@ -147,9 +330,26 @@ def create_user():
         c.execute("SELECT id FROM churches WHERE id = ? AND parent_id = ?", (branch_church_id, main_church_id))
         if not c.fetchone():
             return jsonify({'error': 'Branch church not found or does not belong to your main church!'}), 404
+    except Exception as e:
+        return jsonify({'error': 'An unexpected error occurred: ' + str(e)}), 500
+    finally:
+        conn.close()
+
+    # Hash without holding a connection or the writer slot; retries reuse the hash
+    try:
+        hashed_password = passwords.hash_password(password, _hash_pool())
+    except passwords.HashQueueFull as e:
+        return admission.overloaded_response(str(e), 1)
 
-        hashed_password = generate_password_hash(password)
+    return _create_branch_admin(email, hashed_password, branch_church_id)
+
+@admission.admit_writes
+def _create_branch_admin(email, hashed_password, branch_church_id):
+    conn = get_db()
+    conn.execute('PRAGMA foreign_keys = ON;')
+    c = conn.cursor()
 
+    try:
         # Create the user with role 'branch_admin'
         c.execute("INSERT INTO users (email, password, role, associated_church_id) VALUES (?, ?, ?, ?)",
                   (email, hashed_password, 'branch_admin', branch_church_id))
@@ -163,7 +363,7 @@ def create_user():
         conn.close()
 
 # User login
-@app.route('/login', methods=['POST'])
+@bp.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
     email = data.get('email')
@@ -172,7 +372,7 @@ def login():
     if not email or not password:
         return jsonify({'error': 'Email and password are required!'}), 400
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     conn.execute('PRAGMA foreign_keys = ON;') # Enable foreign key support
     c = conn.cursor()
 
@@ -182,7 +382,14 @@ def login():
 
     conn.close()
 
-    if user and check_password_hash(user[2], password): # user[2] is the hashed password
+    try:
+        valid = user is not None and passwords.verify_password(user[2], password, _hash_pool()) # user[2] is the hashed password
+    except passwords.HashQueueFull as e:
+        return admission.overloaded_response(str(e), 1)
+
+    if valid:
+        if passwords.needs_rehash(user[2]):
+            _rehash_password(user[0], user[2], password)
         return jsonify({
             'message': 'Login successful!',
             'user_id': user[0],
@@ -193,6 +400,33 @@ def login():
     else:
         return jsonify({'error': 'Invalid credentials!'}), 401
 
+# Upgrade a stored hash to the current parameters after a successful login.
+# Not fatal if it doesn't happen: the old hash still works and is upgraded on
+# a later login.
+def _rehash_password(user_id, old_hash, password):
+    try:
+        hashed_password = passwords.hash_password(password, _hash_pool())
+    except passwords.HashQueueFull:
+        return
+    response = _store_password_hash(user_id, old_hash, hashed_password)
+    if response.status_code != 200:
+        current_app.logger.warning('Password hash of user %s not upgraded: %s', user_id, response.get_json(silent=True))
+
+# Writes like any other, so a login burst after a parameter change queues
+# behind the writer slots instead of competing with them
+@admission.admit_writes
+def _store_password_hash(user_id, old_hash, hashed_password):
+    conn = get_db()
+    try:
+        # Unless the password was changed since it was verified
+        conn.execute("UPDATE users SET password = ? WHERE id = ? AND password = ?", (hashed_password, user_id, old_hash))
+        conn.commit()
+        return jsonify({'message': 'Password hash upgraded'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
 # --- Helper for Authorization ---
 def check_auth(request):
     user_id = request.headers.get('User-Id')
@@ -200,42 +434,32 @@ def check_auth(request):
     associated_church_id = request.headers.get('Associated-Church-Id')
     if not user_id or not user_role or not associated_church_id:
         return None, None, None, jsonify({'error': 'Authentication headers missing!'}), 401
+    # Scopes are built from the church id as a number
+    if not (associated_church_id.isascii() and associated_church_id.isdigit()):
+        return None, None, None, jsonify({'error': 'Associated-Church-Id must be an integer!'}), 401
     return user_id, user_role, associated_church_id, None, None
 
 # --- Members Endpoints ---
-@app.route('/members', methods=['GET', 'POST'])
+@bp.route('/members', methods=['GET', 'POST'])
+@admission.admit_writes
 def manage_members():
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     conn.execute('PRAGMA foreign_keys = ON;')
     c = conn.cursor()
 
     if request.method == 'GET':
         try:
-            if user_role == 'main_church':
-                # Main church sees all members from its branches (recursive query or simple check if we assume 1 level)
-                # For simplicity V1: Main church sees members of the church linked to the request (which might be a branch if they are viewing a branch details)
-                # But the requirement says "Main church has access to all data".
-                # Let's allow filtering by church_id query param.
-                target_church_id = request.args.get('church_id')
-                if target_church_id:
-                    # Verify this church belongs to main church hierarchy
-                    c.execute("SELECT id FROM churches WHERE id = ? AND (parent_id = ? OR id = ?)", (target_church_id, associated_church_id, associated_church_id))
-                    if not c.fetchone():
-                        return jsonify({'error': 'Unauthorized access to this church data'}), 403
-                    c.execute("SELECT * FROM members WHERE church_id = ?", (target_church_id,))
-                else:
-                    # Get all members of main church AND its branches
-                    c.execute("SELECT * FROM members WHERE church_id = ? OR church_id IN (SELECT id FROM churches WHERE parent_id = ?)", (associated_church_id, associated_church_id))
-            else:
-                # Branch admin sees only their members
-                c.execute("SELECT * FROM members WHERE church_id = ?", (associated_church_id,))
+            # Main church sees its own members and those of its branches (optionally one
+            # church via ?church_id=), branch admins only see their own members
+            church_ids = data_access.resolve_scope(c, user_role, associated_church_id, request.args.get('church_id'))
+            if church_ids is None:
+                return jsonify({'error': 'Unauthorized access to this church data'}), 403
+            c.execute(*data_access.scoped_select('members', church_ids))
             
-            rows = c.fetchall()
-            members = [{"id": r[0], "name": r[1], "phone": r[2], "address": r[3], "church_id": r[4]} for r in rows]
-            return jsonify(members), 200
+            return serialization.rows_response(c)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
         finally:
@@ -268,28 +492,23 @@ def manage_members():
             conn.close()
 
 # --- Events Endpoints ---
-@app.route('/events', methods=['GET', 'POST'])
+@bp.route('/events', methods=['GET', 'POST'])
+@admission.admit_writes
 def manage_events():
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
 
     if request.method == 'GET':
         try:
-            if user_role == 'main_church':
-                target_church_id = request.args.get('church_id')
-                if target_church_id:
-                    c.execute("SELECT * FROM events WHERE church_id = ?", (target_church_id,))
-                else:
-                    c.execute("SELECT * FROM events WHERE church_id = ? OR church_id IN (SELECT id FROM churches WHERE parent_id = ?)", (associated_church_id, associated_church_id))
-            else:
-                c.execute("SELECT * FROM events WHERE church_id = ?", (associated_church_id,))
+            church_ids = data_access.resolve_scope(c, user_role, associated_church_id, request.args.get('church_id'))
+            if church_ids is None:
+                return jsonify({'error': 'Unauthorized access to this church data'}), 403
+            c.execute(*data_access.scoped_select('events', church_ids))
             
-            rows = c.fetchall()
-            events = [{"id": r[0], "title": r[1], "date": r[2], "description": r[3], "church_id": r[4]} for r in rows]
-            return jsonify(events), 200
+            return serialization.rows_response(c)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
         finally:
@@ -311,28 +530,23 @@ def manage_events():
             conn.close()
 
 # --- Donations Endpoints ---
-@app.route('/donations', methods=['GET', 'POST', 'DELETE'])
+@bp.route('/donations', methods=['GET', 'POST', 'DELETE'])
+@admission.admit_writes
 def manage_donations():
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
 
     if request.method == 'GET':
         try:
-            if user_role == 'main_church':
-                target_church_id = request.args.get('church_id')
-                if target_church_id:
-                    c.execute("SELECT * FROM donations WHERE church_id = ?", (target_church_id,))
-                else:
-                    c.execute("SELECT * FROM donations WHERE church_id = ? OR church_id IN (SELECT id FROM churches WHERE parent_id = ?)", (associated_church_id, associated_church_id))
-            else:
-                c.execute("SELECT * FROM donations WHERE church_id = ?", (associated_church_id,))
+            church_ids = data_access.resolve_scope(c, user_role, associated_church_id, request.args.get('church_id'))
+            if church_ids is None:
+                return jsonify({'error': 'Unauthorized access to this church data'}), 403
+            c.execute(*data_access.scoped_select('donations', church_ids))
             
-            rows = c.fetchall()
-            donations = [{"id": r[0], "amount": r[1], "donor_name": r[2], "date": r[3], "type": r[4], "church_id": r[5]} for r in rows]
-            return jsonify(donations), 200
+            return serialization.rows_response(c)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
         finally:
@@ -344,8 +558,9 @@ def manage_donations():
         if user_role != 'main_church': target_church_id = associated_church_id
 
         try:
-            c.execute("INSERT INTO donations (amount, donor_name, date, type, church_id) VALUES (?, ?, ?, ?, ?)", 
-                      (data['amount'], data.get('donor_name'), data['date'], data.get('type'), target_church_id))
+            donor_id = database.get_or_create_donor(c, data.get('donor_name'))
+            c.execute("INSERT INTO donations (amount, donor_name, date, type, church_id, donor_id) VALUES (?, ?, ?, ?, ?, ?)", 
+                      (data['amount'], data.get('donor_name'), data['date'], data.get('type'), target_church_id, donor_id))
             conn.commit()
             return jsonify({'message': 'Donation recorded', 'id': c.lastrowid}), 201
         except Exception as e:
@@ -372,29 +587,67 @@ def manage_donations():
         finally:
             conn.close()
 
+STATEMENT_FORMATS = {
+    'csv': ('text/csv', reports.stream_csv),
+    'ndjson': ('application/x-ndjson', reports.stream_ndjson)
+}
+
+@bp.route('/donations/statements', methods=['GET'])
+def giving_statements():
+    user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
+    if error_response: return error_response, status_code
+
+    year = request.args.get('year', type=int)
+    output_format = request.args.get('format', 'csv')
+    if not year:
+        return jsonify({'error': 'year is required!'}), 400
+    if output_format not in STATEMENT_FORMATS:
+        return jsonify({'error': 'format must be csv or ndjson!'}), 400
+
+    conn = get_db()
+    c = conn.cursor()
+
+    try:
+        church_ids = data_access.resolve_scope(c, user_role, associated_church_id, request.args.get('church_id'))
+        if church_ids is None:
+            conn.close()
+            return jsonify({'error': 'Unauthorized access to this church data'}), 403
+        reports.giving_statements(c, church_ids, year)
+    except Exception as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 500
+
+    mimetype, stream = STATEMENT_FORMATS[output_format]
+
+    # The connection stays open while the statements stream out
+    def generate():
+        try:
+            yield from stream(c)
+        finally:
+            conn.close()
+
+    response = Response(generate(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename=giving-statements-%d.%s' % (year, output_format)
+    return response
+
 # --- Attendance Endpoints ---
-@app.route('/attendance', methods=['GET', 'POST'])
+@bp.route('/attendance', methods=['GET', 'POST'])
+@admission.admit_writes
 def manage_attendance():
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
 
     if request.method == 'GET':
         try:
-            if user_role == 'main_church':
-                target_church_id = request.args.get('church_id')
-                if target_church_id:
-                    c.execute("SELECT * FROM attendance WHERE church_id = ?", (target_church_id,))
-                else:
-                    c.execute("SELECT * FROM attendance WHERE church_id = ? OR church_id IN (SELECT id FROM churches WHERE parent_id = ?)", (associated_church_id, associated_church_id))
-            else:
-                c.execute("SELECT * FROM attendance WHERE church_id = ?", (associated_church_id,))
+            church_ids = data_access.resolve_scope(c, user_role, associated_church_id, request.args.get('church_id'))
+            if church_ids is None:
+                return jsonify({'error': 'Unauthorized access to this church data'}), 403
+            c.execute(*data_access.scoped_select('attendance', church_ids))
             
-            rows = c.fetchall()
-            attendance = [{"id": r[0], "event_id": r[1], "member_count": r[2], "date": r[3], "church_id": r[4]} for r in rows]
-            return jsonify(attendance), 200
+            return serialization.rows_response(c)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
         finally:
@@ -409,14 +662,107 @@ def manage_attendance():
             c.execute("INSERT INTO attendance (event_id, member_count, date, church_id) VALUES (?, ?, ?, ?)", 
                       (data['event_id'], data['member_count'], data['date'], target_church_id))
             conn.commit()
+            _state().attendance_analytics_cache.clear()
             return jsonify({'message': 'Attendance recorded', 'id': c.lastrowid}), 201
         except Exception as e:
             return jsonify({'error': str(e)}), 500
         finally:
             conn.close()
 
+# Analytics results are cached per app, keyed by request parameters and the
+# latest attendance id. POSTs clear the cache here; other worker processes see
+# the new id in the key.
+
+@bp.route('/attendance/analytics', methods=['GET'])
+def attendance_analytics():
+    user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
+    if error_response: return error_response, status_code
+
+    try:
+        window = int(request.args.get('window', 4))
+        weeks = int(request.args.get('weeks', 0)) or None
+    except ValueError:
+        return jsonify({'error': 'window and weeks must be integers!'}), 400
+    if window < 1 or (weeks is not None and weeks < 1):
+        return jsonify({'error': 'window and weeks must be positive!'}), 400
+
+    conn = get_db()
+    c = conn.cursor()
+
+    try:
+        church_ids = data_access.resolve_scope(c, user_role, associated_church_id, request.args.get('church_id'))
+        if church_ids is None:
+            return jsonify({'error': 'Unauthorized access to this church data'}), 403
+        query, params = data_access.scoped_select(
+            "attendance a JOIN events e ON e.id = a.event_id JOIN churches ch ON ch.id = a.church_id",
+            church_ids,
+            columns="a.church_id, ch.name, a.event_id, e.title, substr(a.date, 1, 10), a.member_count",
+            church_column="a.church_id")
+
+        c.execute("SELECT MAX(id) FROM attendance")
+        cache_key = (query, tuple(params), window, weeks, c.fetchone()[0])
+        cache = _state().attendance_analytics_cache
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached), 200
+
+        c.execute(query, params)
+        rows = c.fetchall()
+        result = _build_attendance_analytics(rows, window, weeks)
+
+        if len(cache) >= current_app.config['ATTENDANCE_ANALYTICS_CACHE_SIZE']:
+            cache.pop(next(iter(cache)), None)
+        cache[cache_key] = result
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+def _build_attendance_analytics(rows, window, weeks):
+    # Attendance recorded with something other than a date ('soon') has no week to go in
+    rows, dates = analytics.dated(rows, 4)
+    if not rows:
+        return {'weeks': [], 'window': window, 'branches': []}
+
+    church_ids, church_names, event_ids, event_titles, _, counts = zip(*rows)
+    keys, calendar, totals = analytics.weekly_matrix(church_ids, dates, counts)
+    averages = analytics.rolling_mean(totals, window)
+    growth = analytics.growth_rates(totals)
+
+    # Trim after computing so the first kept weeks still see their full window
+    if weeks is not None:
+        calendar, totals, averages, growth = calendar[-weeks:], totals[:, -weeks:], averages[:, -weeks:], growth[:, -weeks:]
+
+    names = dict(zip(church_ids, church_names))
+    titles = dict(zip(event_ids, event_titles))
+
+    # Per-event totals for each branch, joined with the event titles
+    keys, event_keys, per_event, sessions = analytics.pivot_totals(church_ids, event_ids, counts, rows=keys)
+
+    branches = []
+    for i, church_id in enumerate(keys.tolist()):
+        events = [
+            {'event_id': event_id, 'title': titles[event_id], 'sessions': int(sessions[i, j]), 'total_attendance': float(per_event[i, j])}
+            for j, event_id in enumerate(event_keys.tolist()) if sessions[i, j]
+        ]
+        branches.append({
+            'church_id': church_id,
+            'church_name': names[church_id],
+            'weekly_totals': analytics.to_list(totals[i]),
+            'rolling_average': analytics.to_list(averages[i]),
+            'growth_rate': analytics.to_list(growth[i]),
+            'events': events
+        })
+
+    return {
+        'weeks': [str(week) for week in calendar],
+        'window': window,
+        'branches': branches
+    }
+
 # --- Stats Endpoint ---
-@app.route('/stats', methods=['GET'])
+@bp.route('/stats', methods=['GET'])
 def get_stats():
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
@@ -424,7 +770,7 @@ def get_stats():
     if user_role != 'main_church':
         return jsonify({'error': 'Unauthorized'}), 403
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
 
     try:
@@ -433,7 +779,8 @@ def get_stats():
         total_branches = c.fetchone()[0]
 
         # Count total members (main church + all branches)
-        c.execute("SELECT COUNT(id) FROM members WHERE church_id = ? OR church_id IN (SELECT id FROM churches WHERE parent_id = ?)", (associated_church_id, associated_church_id))
+        church_ids = data_access.resolve_scope(c, user_role, associated_church_id)
+        c.execute(*data_access.scoped_select('members', church_ids, columns='COUNT(id)'))
         total_members = c.fetchone()[0]
         
         conn.close()
@@ -447,7 +794,7 @@ def get_stats():
         return jsonify({'error': str(e)}), 500
 
 # --- Finances Endpoints (Main Church) ---
-@app.route('/finances/total', methods=['GET'])
+@bp.route('/finances/total', methods=['GET'])
 def get_total_finances():
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
@@ -455,71 +802,66 @@ def get_total_finances():
     if user_role != 'main_church':
         return jsonify({'error': 'Unauthorized'}), 403
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
 
     try:
         search_term = request.args.get('search_term')
-        
-        # Get all churches belonging to the main church's hierarchy
-        # Include main church itself and its branches
-        query = "SELECT id, name FROM churches WHERE id = ? OR parent_id = ?"
-        params = (associated_church_id, associated_church_id)
 
+        # The main church and its branches, narrowed down by name if asked
+        church_ids = data_access.resolve_scope(c, user_role, associated_church_id)
         if search_term:
-            query += " AND name LIKE ?"
-            params += ('%' + search_term + '%',)
-
-        c.execute(query, params)
-        churches = c.fetchall()
-
-        results = []
-        for church_id, church_name in churches:
-            # Calculate total donations for this church
-            c.execute("SELECT SUM(amount) FROM donations WHERE church_id = ?", (church_id,))
-            total_donations = c.fetchone()[0] or 0.0
-
-            # Calculate total expenses for this church
-            c.execute("SELECT SUM(amount) FROM expenses WHERE church_id = ?", (church_id,))
-            total_expenses = c.fetchone()[0] or 0.0
-
-            total_balance = total_donations - total_expenses
-            results.append({
-                'church_id': church_id,
-                'church_name': church_name,
-                'total_balance': total_balance
-            })
-        
-        conn.close()
-        return jsonify(results), 200
+            c.execute(*data_access.scoped_select('churches', church_ids, columns='id', church_column='id',
+                                                 filters=[('name LIKE', '%' + search_term + '%')]))
+            church_ids = [row[0] for row in c.fetchall()]
+        if not church_ids:
+            return jsonify([]), 200
+
+        # One grouped pass over donations and expenses for all of them
+        totals = reports.finance_totals(c, church_ids, {})
+        return jsonify([
+            {'church_id': row['church_id'], 'church_name': row['church_name'], 'total_balance': row['total_balance']}
+            for row in totals['churches']
+        ]), 200
     except Exception as e:
-        conn.close()
         return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
 
 # --- Projects Endpoints ---
-@app.route('/projects', methods=['GET', 'POST'])
+@bp.route('/projects', methods=['GET', 'POST'])
+@admission.admit_writes
 def manage_projects():
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     conn.execute('PRAGMA foreign_keys = ON;')
     c = conn.cursor()
 
     if request.method == 'GET':
         try:
-            if user_role == 'main_church':
-                target_church_id = request.args.get('church_id')
-                if target_church_id:
-                    c.execute("SELECT * FROM projects WHERE church_id = ?", (target_church_id,))
-                else:
-                    c.execute("SELECT * FROM projects WHERE church_id = ? OR church_id IN (SELECT id FROM churches WHERE parent_id = ?)", (associated_church_id, associated_church_id))
+            church_ids = data_access.resolve_scope(c, user_role, associated_church_id, request.args.get('church_id'))
+            if church_ids is None:
+                return jsonify({'error': 'Unauthorized access to this church data'}), 403
+
+            if request.args.get('include_spending', '').lower() in ('1', 'true', 'yes'):
+                # Budget utilization from one grouped join instead of one /expenses call per project
+                query, params = data_access.scoped_select(
+                    "projects p LEFT JOIN expenses e ON e.project_id = p.id",
+                    church_ids,
+                    columns="""p.id, p.name, p.budget, p.church_id,
+                               COALESCE(SUM(e.amount), 0.0) AS spent,
+                               p.budget - COALESCE(SUM(e.amount), 0.0) AS remaining,
+                               COUNT(e.id) AS expense_count,
+                               MAX(e.date) AS last_expense_date""",
+                    church_column="p.church_id",
+                    suffix=" GROUP BY p.id")
             else:
-                c.execute("SELECT * FROM projects WHERE church_id = ?", (associated_church_id,))
+                query, params = data_access.scoped_select('projects', church_ids)
+            c.execute(query, params)
             
-            rows = c.fetchall()
-            projects = [{"id": r[0], "name": r[1], "budget": r[2], "church_id": r[3]} for r in rows]
-            return jsonify(projects), 200
+            return serialization.rows_response(c)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
         finally:
@@ -551,12 +893,13 @@ def manage_projects():
         finally:
             conn.close()
 
-@app.route('/projects/<int:project_id>', methods=['PUT', 'DELETE'])
+@bp.route('/projects/<int:project_id>', methods=['PUT', 'DELETE'])
+@admission.admit_writes
 def manage_single_project(project_id):
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     conn.execute('PRAGMA foreign_keys = ON;')
     c = conn.cursor()
 
@@ -603,46 +946,30 @@ def manage_single_project(project_id):
         conn.close()
 
 # --- Expenses Endpoints ---
-@app.route('/expenses', methods=['GET', 'POST'])
+@bp.route('/expenses', methods=['GET', 'POST'])
+@admission.admit_writes
 def manage_expenses():
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     conn.execute('PRAGMA foreign_keys = ON;')
     c = conn.cursor()
 
     if request.method == 'GET':
         try:
-            query = "SELECT * FROM expenses WHERE church_id = ?"
-            params = [associated_church_id]
-            
+            church_ids = data_access.resolve_scope(c, user_role, associated_church_id, request.args.get('church_id'))
+            if church_ids is None:
+                return jsonify({'error': 'Unauthorized access to this church data'}), 403
+
+            filters = []
             project_id = request.args.get('project_id')
             if project_id:
-                query += " AND project_id = ?"
-                params.append(project_id)
-
-            if user_role == 'main_church':
-                target_church_id = request.args.get('church_id')
-                if target_church_id:
-                    # Verify this church belongs to main church hierarchy
-                    c.execute("SELECT id FROM churches WHERE id = ? AND (parent_id = ? OR id = ?)", (target_church_id, associated_church_id, associated_church_id))
-                    if not c.fetchone():
-                        return jsonify({'error': 'Unauthorized access to this church data'}), 403
-                    query = query.replace("WHERE church_id = ?", "WHERE church_id = ?") # Replace to use target_church_id
-                    params[0] = target_church_id # Update the church_id in params
-                else:
-                    # Get all expenses of main church AND its branches
-                    query = "SELECT * FROM expenses WHERE church_id = ? OR church_id IN (SELECT id FROM churches WHERE parent_id = ?)"
-                    params = (associated_church_id, associated_church_id)
-                    if project_id:
-                        query += " AND project_id = ?"
-                        params += (project_id,)
+                filters.append(('project_id', project_id))
+
+            c.execute(*data_access.scoped_select('expenses', church_ids, filters=filters))
             
-            c.execute(query, params)
-            rows = c.fetchall()
-            expenses = [{"id": r[0], "description": r[1], "amount": r[2], "date": r[3], "project_id": r[4], "church_id": r[5]} for r in rows]
-            return jsonify(expenses), 200
+            return serialization.rows_response(c)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
         finally:
@@ -676,12 +1003,13 @@ def manage_expenses():
         finally:
             conn.close()
 
-@app.route('/expenses/<int:expense_id>', methods=['PUT', 'DELETE'])
+@bp.route('/expenses/<int:expense_id>', methods=['PUT', 'DELETE'])
+@admission.admit_writes
 def manage_single_expense(expense_id):
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     conn.execute('PRAGMA foreign_keys = ON;')
     c = conn.cursor()
 
@@ -729,12 +1057,12 @@ def manage_single_expense(expense_id):
         conn.close()
 
 # --- Finances Balance Endpoint ---
-@app.route('/finances/balance/<int:church_id>', methods=['GET'])
+@bp.route('/finances/balance/<int:church_id>', methods=['GET'])
 def get_church_balance(church_id):
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
 
     try:
@@ -780,9 +1108,121 @@ def get_church_balance(church_id):
         conn.close()
         return jsonify({'error': str(e)}), 500
 
+# --- Forecast Endpoint ---
+FORECAST_WINDOW = 8
+# A quarter
+FORECAST_HORIZON = 13
+FORECAST_SERIES_WEEKS = 12
+# Two years; every series is at least window weeks long, so window bounds the memory a forecast takes
+FORECAST_MAX_WEEKS = 104
+
+@bp.route('/finances/forecast', methods=['GET'])
+def finance_forecast():
+    user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
+    if error_response: return error_response, status_code
+
+    try:
+        window = int(request.args.get('window', FORECAST_WINDOW))
+        horizon = int(request.args.get('horizon', FORECAST_HORIZON))
+        weeks = int(request.args.get('weeks', FORECAST_SERIES_WEEKS))
+    except ValueError:
+        return jsonify({'error': 'window, horizon and weeks must be integers!'}), 400
+    if window < 1 or horizon < 1 or weeks < 1:
+        return jsonify({'error': 'window, horizon and weeks must be positive!'}), 400
+    if max(window, horizon, weeks) > FORECAST_MAX_WEEKS:
+        return jsonify({'error': 'window, horizon and weeks can be at most %d!' % FORECAST_MAX_WEEKS}), 400
+    try:
+        as_of = analytics.day(request.args.get('as_of'))
+    except ValueError:
+        return jsonify({'error': 'as_of must be a date (YYYY-MM-DD)!'}), 400
+
+    conn = get_db()
+    c = conn.cursor()
+
+    try:
+        church_ids = data_access.resolve_scope(c, user_role, associated_church_id, request.args.get('church_id'))
+        if church_ids is None:
+            return jsonify({'error': 'Unauthorized access to this church data'}), 403
+
+        # Everything up to and including as_of, so past dates give a backtest
+        until = [('date <', str(as_of + 1))]
+        c.execute(*data_access.scoped_select('churches', church_ids, columns='id, name', church_column='id', suffix=' ORDER BY id'))
+        churches = c.fetchall()
+        c.execute(*data_access.scoped_select('projects', church_ids, columns='id, name, budget, church_id', suffix=' ORDER BY id'))
+        projects = c.fetchall()
+        # Donations arrive in bunches on service days; daily totals come straight off the (church_id, date) index
+        c.execute(*data_access.scoped_select('donations', church_ids, columns='church_id, substr(date, 1, 10), SUM(amount)', filters=until, suffix=' GROUP BY church_id, date'))
+        donations = analytics.records(c.fetchall(), analytics.DONATION_FIELDS)
+        c.execute(*data_access.scoped_select('expenses', church_ids, columns='church_id, COALESCE(project_id, -1), substr(date, 1, 10), amount', filters=until))
+        expenses = analytics.records(c.fetchall(), analytics.EXPENSE_FIELDS)
+
+        return serialization.json_response(_build_finance_forecast(churches, projects, donations, expenses, as_of, window, horizon, weeks))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+def _columns(rows, n):
+    # Column tuples of rows, n empty ones if there are no rows
+    return tuple(zip(*rows)) if rows else ((),) * n
+
+def _build_finance_forecast(churches, projects, donations, expenses, as_of, window, horizon, weeks):
+    church_ids, church_names = _columns(churches, 2)
+    project_ids, project_names, budgets, project_churches = _columns(projects, 4)
+    f = analytics.finance_forecast(church_ids, project_ids, budgets, donations, expenses, as_of, window, horizon)
+
+    # Vectors are converted once, the per-row loops only zip them up
+    donation_rate, expense_rate = analytics.to_list(f['donation_rate']), analytics.to_list(f['expense_rate'])
+    balance, projected = analytics.to_list(f['balance']), analytics.to_list(f['projected_balance'])
+    balance_exhaustion = analytics.to_dates(f['balance_exhaustion'])
+    donation_average = analytics.to_list(f['donation_average'][:, -weeks:])
+    expense_average = analytics.to_list(f['expense_average'][:, -weeks:])
+
+    burn_rate, spent, remaining = analytics.to_list(f['burn_rate']), analytics.to_list(f['spent']), analytics.to_list(f['remaining'])
+    weeks_left, budget_exhaustion = analytics.to_list(f['weeks_left'], 1), analytics.to_dates(f['budget_exhaustion'])
+    spending_average = analytics.to_list(f['spending_average'][:, -weeks:])
+
+    return {
+        'as_of': str(as_of),
+        'window': window,
+        'horizon_weeks': horizon,
+        'projected_on': str(as_of + horizon * 7),
+        'weeks': analytics.to_dates(f['calendar'][-weeks:]),
+        'churches': [
+            {
+                'church_id': church_id,
+                'church_name': church_names[i],
+                'balance': balance[i],
+                'weekly_donations': donation_rate[i],
+                'weekly_expenses': expense_rate[i],
+                'projected_balance': projected[i],
+                'balance_exhaustion_date': balance_exhaustion[i],
+                'donations_moving_average': donation_average[i],
+                'expenses_moving_average': expense_average[i]
+            }
+            for i, church_id in enumerate(church_ids)
+        ],
+        'projects': [
+            {
+                'project_id': project_id,
+                'name': project_names[i],
+                'church_id': project_churches[i],
+                'budget': budgets[i],
+                'spent': spent[i],
+                'remaining': remaining[i],
+                'weekly_burn_rate': burn_rate[i],
+                'weeks_left': weeks_left[i],
+                'exhaustion_date': budget_exhaustion[i],
+                'spending_moving_average': spending_average[i]
+            }
+            for i, project_id in enumerate(project_ids)
+        ]
+    }
+
 # --- Messaging Endpoints ---
 
-@app.route('/messages', methods=['POST'])
+@bp.route('/messages', methods=['POST'])
+@admission.admit_writes
 def send_message():
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
@@ -794,7 +1234,7 @@ def send_message():
     if not receiver_church_id or not message_content:
         return jsonify({'error': 'Receiver and message content are required!'}), 400
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
 
     try:
@@ -807,12 +1247,12 @@ def send_message():
     finally:
         conn.close()
 
-@app.route('/conversations', methods=['GET'])
+@bp.route('/conversations', methods=['GET'])
 def get_conversations():
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
 
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
 
     try:
@@ -843,31 +1283,322 @@ def get_conversations():
         conn.close()
 
 
-@app.route('/messages/<int:other_church_id>', methods=['GET'])
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 200
+
+# Each direction of the conversation is read newest/oldest first from the
+# (sender, receiver, id) index and capped before the two are merged
+_MESSAGES_BEFORE_SQL = """
+    SELECT * FROM (
+        SELECT * FROM (SELECT * FROM messages WHERE sender_church_id = ? AND receiver_church_id = ? AND id < ? ORDER BY id DESC LIMIT ?)
+        UNION ALL
+        SELECT * FROM (SELECT * FROM messages WHERE sender_church_id = ? AND receiver_church_id = ? AND id < ? ORDER BY id DESC LIMIT ?)
+        ORDER BY id DESC LIMIT ?
+    ) ORDER BY id ASC
+"""
+_MESSAGES_AFTER_SQL = """
+    SELECT * FROM (SELECT * FROM messages WHERE sender_church_id = ? AND receiver_church_id = ? AND id > ? ORDER BY id ASC LIMIT ?)
+    UNION ALL
+    SELECT * FROM (SELECT * FROM messages WHERE sender_church_id = ? AND receiver_church_id = ? AND id > ? ORDER BY id ASC LIMIT ?)
+    ORDER BY id ASC LIMIT ?
+"""
+# Messages a church sent to itself: both directions are the same rows
+_MESSAGES_SELF_BEFORE_SQL = """
+    SELECT * FROM (SELECT * FROM messages WHERE sender_church_id = ? AND receiver_church_id = ? AND id < ? ORDER BY id DESC LIMIT ?)
+    ORDER BY id ASC
+"""
+_MESSAGES_SELF_AFTER_SQL = """
+    SELECT * FROM messages WHERE sender_church_id = ? AND receiver_church_id = ? AND id > ? ORDER BY id ASC LIMIT ?
+"""
+
+def _int_arg(name, default=None):
+    # Query parameter as an int, default if absent; raises ValueError if it isn't one
+    value = request.args.get(name)
+    return default if value is None else int(value)
+
+@bp.route('/messages/<int:other_church_id>', methods=['GET'])
 def get_messages(other_church_id):
     user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
     if error_response: return error_response, status_code
 
-    conn = sqlite3.connect('database.db')
+    # Pages are ordered by message id: no cursor returns the latest page,
+    # before_id pages back in history and after_id fetches newer messages
+    try:
+        before_id = _int_arg('before_id')
+        after_id = _int_arg('after_id')
+        limit = _int_arg('limit', MESSAGES_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'before_id, after_id and limit must be integers!'}), 400
+    if before_id is not None and after_id is not None:
+        return jsonify({'error': 'Use either before_id or after_id, not both!'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive!'}), 400
+    limit = min(limit, MESSAGES_MAX_PAGE_SIZE)
+
+    conn = get_db()
     c = conn.cursor()
 
     try:
         my_church_id = int(associated_church_id)
+        # One extra row tells whether another page exists in the same direction
+        fetch = limit + 1
+        is_self = other_church_id == my_church_id
+        if after_id is not None:
+            if is_self:
+                c.execute(_MESSAGES_SELF_AFTER_SQL, (my_church_id, my_church_id, after_id, fetch))
+            else:
+                c.execute(_MESSAGES_AFTER_SQL, (my_church_id, other_church_id, after_id, fetch,
+                                                other_church_id, my_church_id, after_id, fetch, fetch))
+            rows = c.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+        else:
+            cursor_id = before_id if before_id is not None else 2 ** 63 - 1
+            if is_self:
+                c.execute(_MESSAGES_SELF_BEFORE_SQL, (my_church_id, my_church_id, cursor_id, fetch))
+            else:
+                c.execute(_MESSAGES_BEFORE_SQL, (my_church_id, other_church_id, cursor_id, fetch,
+                                                 other_church_id, my_church_id, cursor_id, fetch, fetch))
+            rows = c.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[-limit:]
+
+        response = serialization.rows_response(c, rows)
+        response.headers['X-Has-More'] = 'true' if has_more else 'false'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# --- Sync Endpoint ---
+SYNC_PAGE_SIZE = 1000
+SYNC_MAX_PAGE_SIZE = 5000
+SYNC_TABLES = {table for table, church_column, peer_column in database.CHANGE_LOG_TABLES}
+
+@bp.route('/sync', methods=['GET'])
+def sync():
+    user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
+    if error_response: return error_response, status_code
+
+    try:
+        # A malformed cursor must not be mistaken for no cursor, which jumps to the head
+        since = _int_arg('since')
+        limit = min(_int_arg('limit', SYNC_PAGE_SIZE), SYNC_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers!'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive!'}), 400
+    # The generation next_since was handed out with
+    generation = request.args.get('generation')
+
+    conn = get_db()
+    c = conn.cursor()
+
+    try:
+        # Cursors are only meaningful within one generation of the database:
+        # a restore or reset rewinds change_log and reuses its sequence numbers
+        if not conn.in_transaction:
+            c.execute('BEGIN')
+        c.execute("SELECT value FROM db_meta WHERE key = 'generation'")
+        current_generation = c.fetchone()[0]
+        c.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log")
+        head = c.fetchone()[0]
+
+        # Without a cursor, return the current sequence: the client does a
+        # full fetch and syncs from there on
+        if since is None:
+            return serialization.json_response({'changes': [], 'next_since': head, 'generation': current_generation, 'has_more': False})
+        # A cursor from before a restore: changes may have been skipped, so
+        # the client has to fetch everything again and sync from the head
+        if (generation is not None and generation != current_generation) or since > head:
+            return jsonify({'error': 'The sync cursor is no longer valid, please fetch all data again',
+                            'next_since': head, 'generation': current_generation}), 410
+
+        church_ids = data_access.resolve_scope(c, user_role, associated_church_id)
+        my_church_id = int(associated_church_id)
+
+        # Church data follows the usual hierarchy scope; messages only those the caller sent or received
         c.execute("""
-            SELECT * FROM messages 
-            WHERE (sender_church_id = ? AND receiver_church_id = ?) 
-               OR (sender_church_id = ? AND receiver_church_id = ?)
-            ORDER BY timestamp ASC
-        """, (my_church_id, other_church_id, other_church_id, my_church_id))
-        
-        rows = c.fetchall()
-        messages = [{"id": r[0], "sender_church_id": r[1], "receiver_church_id": r[2], "message_content": r[3], "timestamp": r[4]} for r in rows]
-        
-        return jsonify(messages), 200
+            SELECT seq, table_name, row_id, op FROM change_log
+            WHERE church_id IN (%s) AND seq > ? AND table_name != 'messages'
+            UNION ALL
+            SELECT seq, table_name, row_id, op FROM change_log
+            WHERE church_id = ? AND seq > ? AND table_name = 'messages'
+            UNION ALL
+            SELECT seq, table_name, row_id, op FROM change_log
+            WHERE peer_church_id = ? AND seq > ? AND table_name = 'messages'
+            ORDER BY seq LIMIT ?
+        """ % data_access.in_placeholders(church_ids),
+            data_access.padded_ids(church_ids) + [since, my_church_id, since, my_church_id, since, limit + 1])
+        log = c.fetchall()
+        has_more = len(log) > limit
+        log = log[:limit]
+
+        # Keep only the latest change of each row in this page
+        latest = {}
+        for seq, table_name, row_id, op in log:
+            latest[(table_name, row_id)] = (seq, op)
+
+        # Current contents of inserted/updated rows, one query per table
+        ids_by_table = {}
+        for (table_name, row_id), (seq, op) in latest.items():
+            if op != 'delete' and table_name in SYNC_TABLES:
+                ids_by_table.setdefault(table_name, []).append(row_id)
+        rows_by_key = {}
+        for table_name, ids in ids_by_table.items():
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                c.execute("SELECT * FROM %s WHERE id IN (%s)" % (table_name, ', '.join('?' * len(chunk))), chunk)
+                for row in serialization.rows_to_dicts(c):
+                    rows_by_key[(table_name, row['id'])] = row
+
+        changes = []
+        for (table_name, row_id), (seq, op) in sorted(latest.items(), key=lambda item: item[1][0]):
+            data = rows_by_key.get((table_name, row_id))
+            if op != 'delete' and data is None:
+                # Deleted after this page; the delete shows up in a later page
+                continue
+            changes.append({'seq': seq, 'table': table_name, 'op': op, 'id': row_id, 'data': data})
+
+        next_since = log[-1][0] if log else since
+        return serialization.json_response({'changes': changes, 'next_since': next_since, 'generation': current_generation, 'has_more': has_more})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# --- Report Jobs Endpoints ---
+@bp.route('/jobs', methods=['POST'])
+def submit_job():
+    user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
+    if error_response: return error_response, status_code
+
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    params = data.get('params') or {}
+    if kind not in jobs.REPORTS:
+        return jsonify({'error': 'kind must be one of: %s' % ', '.join(jobs.REPORTS)}), 400
+    if not isinstance(params, dict):
+        return jsonify({'error': 'params must be an object!'}), 400
+    if kind == 'export' and params.get('table') not in data_access.SCOPED_TABLES:
+        return jsonify({'error': 'table must be one of: %s' % ', '.join(data_access.SCOPED_TABLES)}), 400
+
+    conn = get_db()
+    c = conn.cursor()
+
+    try:
+        # The whole hierarchy, or one church of it via params.church_id
+        church_ids = data_access.resolve_scope(c, user_role, associated_church_id, params.get('church_id'))
+        if church_ids is None:
+            return jsonify({'error': 'Unauthorized access to this church data'}), 403
+        job = _get_jobs().submit(kind, params, church_ids, associated_church_id, jobs.data_version(c))
+    except jobs.JobQueueFull as e:
+        return admission.overloaded_response(str(e), 5)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
+    # Cache hits are done already and come back with their result
+    queue = _get_jobs()
+    response = Response(queue.response_body(job), status=200 if job['status'] == 'done' else 202, mimetype='application/json')
+    response.headers['Location'] = '/jobs/%s' % job['id']
+    return response
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
+    if error_response: return error_response, status_code
+
+    queue = _get_jobs()
+    job = queue.get(job_id)
+    # Other churches' jobs are reported as missing
+    if job is None or job['owner'] != str(associated_church_id):
+        return jsonify({'error': 'Job not found'}), 404
+    return Response(queue.response_body(job), mimetype='application/json')
+
+# --- Batch Endpoint ---
+BATCH_MAX_REQUESTS = 20
+AUTH_HEADERS = ('User-Id', 'User-Role', 'Associated-Church-Id')
+# Response headers that carry part of the result, passed on with each sub-response
+BATCH_RESPONSE_HEADERS = ('X-Has-More', 'Location', 'Retry-After')
+
+@bp.route('/batch', methods=['POST'])
+def batch():
+    user_id, user_role, associated_church_id, error_response, status_code = check_auth(request)
+    if error_response: return error_response, status_code
+
+    data = request.get_json(silent=True) or {}
+    sub_requests = data.get('requests')
+
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return jsonify({'error': 'A non-empty list of requests is required!'}), 400
+    if len(sub_requests) > BATCH_MAX_REQUESTS:
+        return jsonify({'error': 'A batch can contain at most %d requests!' % BATCH_MAX_REQUESTS}), 400
+
+    # Every sub-request runs with the caller's credentials
+    headers = {name: request.headers.get(name) for name in AUTH_HEADERS}
+
+    # One connection and one read transaction for the whole batch, so all
+    # results come from the same snapshot of the database
+    shared_conn = connect_db(factory=_SharedConnection)
+    shared_conn.execute('BEGIN')
+
+    app = current_app._get_current_object()
+    responses = []
+    try:
+        for sub_request in sub_requests:
+            if not isinstance(sub_request, dict) or not sub_request.get('path'):
+                responses.append({'path': None, 'status': 400, 'headers': {}, 'body': {'error': 'Each request needs a path!'}})
+                continue
+
+            path = sub_request['path']
+            method = sub_request.get('method', 'GET').upper()
+
+            # Only reads are batched; writes would end the shared read transaction
+            if method != 'GET':
+                responses.append({'path': path, 'status': 405, 'headers': {}, 'body': {'error': 'Only GET requests can be batched!'}})
+                continue
+            if path.split('?', 1)[0].rstrip('/') == '/batch':
+                responses.append({'path': path, 'status': 400, 'headers': {}, 'body': {'error': 'Batches cannot be nested!'}})
+                continue
+
+            with app.test_request_context(path, method=method, headers=headers):
+                g.shared_conn = shared_conn
+                response = app.full_dispatch_request()
+                g.pop('shared_conn', None)
+
+            if not response.is_json:
+                # Streamed exports and the like; closing the response stops its generator
+                response.close()
+                if response.status_code < 400:
+                    responses.append({'path': path, 'status': 400, 'headers': {}, 'body': {'error': 'Only endpoints that return JSON can be batched!'}})
+                else:
+                    responses.append({'path': path, 'status': response.status_code, 'headers': {}, 'body': {'error': response.status}})
+                continue
+
+            responses.append({
+                'path': path,
+                'status': response.status_code,
+                'headers': {name: response.headers[name] for name in BATCH_RESPONSE_HEADERS if name in response.headers},
+                'body': response.get_json(silent=True)
+            })
+
+        return jsonify({'responses': responses}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        shared_conn.rollback()
+        shared_conn.release()
+
 if __name__ == '__main__':
-    app.run(debug=True, host='http://192.168.100.221:8888', port=8888)
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    app = create_app()
+    init_worker(app)
+    # The debugger runs arbitrary code for whoever reaches it, so it is opt-in
+    # and then only listens on localhost unless HOST says otherwise
+    debug = os.environ.get('FLASK_DEBUG', '0') == '1'
+    app.run(debug=debug,
+            host=os.environ.get('HOST', '127.0.0.1' if debug else '0.0.0.0'),
+            port=int(os.environ.get('PORT', 8888)))
@@ -0,0 +1,180 @@
+"""Online backups and point-in-time restore.
+
+Backups copy the live database with SQLite's online backup API a few pages
+at a time, sleeping between steps, so the API keeps serving requests while
+a backup runs. Each run leaves a timestamped snapshot in the backup
+directory; restoring to a point in time rebuilds the database from the
+newest snapshot taken at or before that time.
+
+    python backup.py create [--database database.db] [--dir backups]
+    python backup.py list [--dir backups]
+    python backup.py restore --at 2026-10-19T18:00:00 [--database database.db] [--dir backups]
+    python backup.py prune --keep 30 [--dir backups]
+
+Times are UTC.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import database
+
+BACKUP_DIR = 'backups'
+PAGES_PER_STEP = 64
+STEP_SLEEP = 0.005
+# A copy that keeps restarting because of concurrent writes is finished in one step instead
+MAX_RESTARTS = 3
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S%fZ'
+
+class _TooManyRestarts(Exception):
+    pass
+
+def _copy(src, dest, pages, sleep):
+    # Page-stepped copy that yields between steps. Every write to the source
+    # from another connection restarts it, so after MAX_RESTARTS the rest is
+    # copied in a single step; in WAL mode that still doesn't block writers.
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        if state['remaining'] is not None and remaining >= state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        state['remaining'] = remaining
+        time.sleep(sleep)
+
+    try:
+        src.backup(dest, pages=pages, progress=progress)
+    except _TooManyRestarts:
+        src.backup(dest, pages=-1)
+
+def _snapshot_name(moment):
+    return 'backup-%s.db' % moment.strftime(TIMESTAMP_FORMAT)
+
+def _parse_snapshot_name(name):
+    if not (name.startswith('backup-') and name.endswith('.db')):
+        return None
+    try:
+        return datetime.strptime(name[len('backup-'):-len('.db')], TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def create_backup(db_path, backup_dir=BACKUP_DIR, pages=PAGES_PER_STEP, sleep=STEP_SLEEP, uri=False):
+    """Copy the database at db_path into a new snapshot in backup_dir and return its path.
+
+    Copies pages pages per step and sleeps between steps so the copy never
+    hogs the disk or the GIL. If the database changes mid-copy, SQLite
+    restarts the copy, so the snapshot is always consistent. It holds the
+    database as of the end of the copy, which is when it is timestamped.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    fd, partial = tempfile.mkstemp(prefix='backup-', suffix='.db.partial', dir=backup_dir)
+    os.close(fd)
+
+    src = sqlite3.connect(db_path, uri=uri)
+    dest = sqlite3.connect(partial)
+    try:
+        _copy(src, dest, pages, sleep)
+    finally:
+        dest.close()
+        src.close()
+
+    # Only complete snapshots get a name restore() looks at. Writes up to the
+    # end of the copy may be in it, so restoring to a time before that must
+    # not pick it.
+    path = os.path.join(backup_dir, _snapshot_name(datetime.now(timezone.utc)))
+    os.replace(partial, path)
+    return path
+
+def list_backups(backup_dir=BACKUP_DIR):
+    # (taken_at, path) of every snapshot, oldest first
+    if not os.path.isdir(backup_dir):
+        return []
+    snapshots = []
+    for name in os.listdir(backup_dir):
+        taken_at = _parse_snapshot_name(name)
+        if taken_at is not None:
+            snapshots.append((taken_at, os.path.join(backup_dir, name)))
+    return sorted(snapshots)
+
+def restore_backup(db_path, at=None, backup_dir=BACKUP_DIR, pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    """Rebuild the database at db_path from the newest snapshot taken at or before at (default: latest).
+
+    The restore also goes through the backup API, so a running app sees the
+    database switch over atomically instead of a half-copied file. It then
+    gets a new generation id, so report results cached before the restore
+    are not served for it. Returns the path of the snapshot used.
+    """
+    snapshots = list_backups(backup_dir)
+    if at is not None:
+        snapshots = [snapshot for snapshot in snapshots if snapshot[0] <= at]
+    if not snapshots:
+        raise LookupError('No backup in %s taken at or before %s' % (backup_dir, at or 'now'))
+
+    taken_at, path = snapshots[-1]
+    src = sqlite3.connect(path)
+    dest = sqlite3.connect(db_path)
+    try:
+        _copy(src, dest, pages, sleep)
+        database.new_generation(dest)
+    finally:
+        dest.close()
+        src.close()
+    return path
+
+def prune_backups(keep, backup_dir=BACKUP_DIR):
+    # Delete all but the newest keep snapshots; returns the deleted paths
+    snapshots = list_backups(backup_dir)
+    removed = [path for taken_at, path in snapshots[:-keep]] if keep > 0 else [path for taken_at, path in snapshots]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+def _parse_time(value):
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Online backup and point-in-time restore of the SQLite database.')
+    parser.add_argument('--dir', default=BACKUP_DIR, help='backup directory (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    create = commands.add_parser('create', help='take a snapshot of the live database')
+    create.add_argument('--database', default=database.default_path())
+    create.add_argument('--pages', type=int, default=PAGES_PER_STEP, help='pages copied per step')
+
+    commands.add_parser('list', help='list snapshots')
+
+    restore = commands.add_parser('restore', help='restore the database as of a point in time')
+    restore.add_argument('--database', default=database.default_path())
+    restore.add_argument('--at', type=_parse_time, help='ISO time, UTC unless an offset is given (default: latest)')
+
+    prune = commands.add_parser('prune', help='delete old snapshots')
+    prune.add_argument('--keep', type=int, required=True)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'create':
+        print(create_backup(args.database, args.dir, pages=args.pages))
+    elif args.command == 'list':
+        for taken_at, path in list_backups(args.dir):
+            print('%s  %s' % (taken_at.isoformat(), path))
+    elif args.command == 'restore':
+        try:
+            path = restore_backup(args.database, args.at, args.dir)
+        except LookupError as e:
+            print(e, file=sys.stderr)
+            return 1
+        print('Restored %s from %s' % (args.database, path))
+    elif args.command == 'prune':
+        for path in prune_backups(args.keep, args.dir):
+            print('Removed %s' % path)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# Request latency with and without an online backup running.
+# Run from the repository root: python benchmarks/bench_backup_latency.py [members]
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup
+from app import create_app, dispose_app
+
+BRANCHES = 50
+HEADERS = {'User-Id': '1', 'User-Role': 'main_church', 'Associated-Church-Id': '1'}
+
+def build_app(directory, n_members):
+    path = os.path.join(directory, 'bench.db')
+    app = create_app({'DATABASE': path})
+    with app.app_context():
+        app.test_client().get('/health')
+    # First connection bootstraps the schema; fill it directly
+    app.test_client().get('/members', headers=HEADERS)
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO churches (name) VALUES ('Main')")
+    conn.executemany("INSERT INTO churches (name, parent_id) VALUES (?, 1)", [('Branch %d' % i,) for i in range(BRANCHES)])
+    conn.executemany("INSERT INTO members (name, phone, address, church_id) VALUES (?, ?, ?, ?)",
+                     (('Member %d' % i, '+237 6%08d' % i, '%d Church Street' % i, 2 + i % BRANCHES) for i in range(n_members)))
+    conn.commit()
+    conn.close()
+    return app, path
+
+def measure(client, seconds):
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    i = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        client.get('/members?church_id=%d' % (2 + i % BRANCHES), headers=HEADERS)
+        if i % 10 == 0:
+            client.post('/members', json={'name': 'New member', 'church_id': 2 + i % BRANCHES}, headers=HEADERS)
+        latencies.append(time.perf_counter() - start)
+        i += 1
+    return latencies
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print('%-16s %6d requests  p50 %6.2f ms  p99 %6.2f ms  max %7.2f ms' % (
+        name, len(latencies), statistics.median(latencies) * 1000, p99 * 1000, latencies[-1] * 1000))
+
+def main():
+    n_members = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    directory = tempfile.mkdtemp()
+    try:
+        app, path = build_app(directory, n_members)
+        client = app.test_client()
+        print('%d members, %.1f MB database' % (n_members, os.path.getsize(path) / 1e6))
+
+        report('no backup', measure(client, 3))
+
+        durations = []
+        def run_backups(stop):
+            while not stop.is_set():
+                start = time.perf_counter()
+                backup.create_backup(path, os.path.join(directory, 'backups'))
+                durations.append(time.perf_counter() - start)
+        stop = threading.Event()
+        worker = threading.Thread(target=run_backups, args=(stop,))
+        worker.start()
+        latencies = measure(client, 3)
+        stop.set()
+        worker.join()
+        report('during backup', latencies)
+        print('%d backups completed, %.2f s each on average' % (len(durations), statistics.mean(durations)))
+        dispose_app(app)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
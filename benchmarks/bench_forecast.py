@@ -0,0 +1,136 @@
+# /finances/forecast on large hierarchies: the vectorized pass vs. a per-church,
+# per-project loop doing the same maths one series at a time.
+# Run from the repository root: python benchmarks/bench_forecast.py [branches ...]
+import datetime
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics
+from app import create_app, dispose_app
+
+WEEKS = 104
+PROJECTS_PER_BRANCH = 3
+# Per church and week: gifts at the Sunday service, expenses through the week
+DONATIONS_PER_WEEK = 8
+EXPENSES_PER_WEEK = 2
+WINDOW = 8
+HORIZON = 13
+AS_OF = '2026-06-30'
+HEADERS = {'User-Id': '1', 'User-Role': 'main_church', 'Associated-Church-Id': '1'}
+
+def build_app(directory, n_branches):
+    path = os.path.join(directory, 'bench-%d.db' % n_branches)
+    app = create_app({'DATABASE': path, 'JOB_DIR': os.path.join(directory, 'jobs')})
+    # First connection bootstraps the schema; fill it directly
+    app.test_client().get('/members', headers=HEADERS)
+
+    rng = random.Random(n_branches)
+    end = datetime.date.fromisoformat(AS_OF)
+    sundays = [str(end - datetime.timedelta(days=7 * w + (end.weekday() + 1) % 7)) for w in range(WEEKS)]
+    days = [str(end - datetime.timedelta(days=d)) for d in range(7 * WEEKS)]
+    church_ids = list(range(1, n_branches + 2))
+
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO churches (name) VALUES ('Main')")
+    conn.executemany("INSERT INTO churches (name, parent_id) VALUES (?, 1)", [('Branch %d' % i,) for i in range(n_branches)])
+    conn.executemany("INSERT INTO projects (name, budget, church_id) VALUES (?, ?, ?)",
+                     (('Project %d-%d' % (church_id, p), rng.uniform(5000, 50000), church_id)
+                      for church_id in church_ids for p in range(PROJECTS_PER_BRANCH)))
+    conn.executemany("INSERT INTO donations (amount, donor_name, date, type, church_id) VALUES (?, 'Donor', ?, 'offering', ?)",
+                     ((rng.uniform(10, 200), date, church_id) for church_id in church_ids for date in sundays for _ in range(DONATIONS_PER_WEEK)))
+    conn.executemany("INSERT INTO expenses (description, amount, date, project_id, church_id) VALUES ('Expense', ?, ?, ?, ?)",
+                     ((rng.uniform(20, 300), rng.choice(days), (church_id - 1) * PROJECTS_PER_BRANCH + rng.randrange(PROJECTS_PER_BRANCH) + 1
+                       if rng.random() < 0.75 else None, church_id)
+                      for church_id in church_ids for _ in range(WEEKS * EXPENSES_PER_WEEK)))
+    conn.commit()
+    conn.close()
+    return app, path
+
+def loop_forecast(path):
+    # What a treasurer's spreadsheet does: one series at a time
+    conn = sqlite3.connect(path)
+    as_of = datetime.date.fromisoformat(AS_OF)
+
+    def weekly(rows):
+        series = {}
+        for date, amount in rows:
+            age = (as_of - datetime.date.fromisoformat(date[:10])).days // 7
+            series[age] = series.get(age, 0.0) + amount
+        rate = sum(series.get(age, 0.0) for age in range(WINDOW)) / WINDOW
+        averages = [sum(series.get(age + k, 0.0) for k in range(WINDOW)) / WINDOW for age in range(12)]
+        return sum(series.values()), rate, averages
+
+    churches = []
+    for church_id, name in conn.execute("SELECT id, name FROM churches WHERE id = 1 OR parent_id = 1 ORDER BY id"):
+        donated, donation_rate, donation_average = weekly(conn.execute(
+            "SELECT date, amount FROM donations WHERE church_id = ? AND date <= ?", (church_id, AS_OF)).fetchall())
+        spent, expense_rate, expense_average = weekly(conn.execute(
+            "SELECT date, amount FROM expenses WHERE church_id = ? AND date <= ?", (church_id, AS_OF)).fetchall())
+        churches.append((church_id, donated - spent, donated - spent + (donation_rate - expense_rate) * HORIZON,
+                         donation_average, expense_average))
+
+    projects = []
+    for project_id, budget in conn.execute("SELECT p.id, p.budget FROM projects p JOIN churches ch ON ch.id = p.church_id WHERE ch.id = 1 OR ch.parent_id = 1 ORDER BY p.id").fetchall():
+        spent, rate, averages = weekly(conn.execute(
+            "SELECT date, amount FROM expenses WHERE project_id = ? AND date <= ?", (project_id, AS_OF)).fetchall())
+        exhaustion = as_of + datetime.timedelta(days=round(max(budget - spent, 0) / rate * 7)) if rate > 0 else None
+        projects.append((project_id, budget - spent, rate, exhaustion, averages))
+    conn.close()
+    return churches, projects
+
+def timed(func, timings):
+    # func, recording how long each call takes
+    def wrapper(*args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            timings.append(time.perf_counter() - start)
+    return wrapper
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 300, 800]
+    directory = tempfile.mkdtemp()
+    # Time the NumPy pass on its own; the rest of the request is loading rows from SQLite
+    compute_timings = []
+    analytics.finance_forecast = timed(analytics.finance_forecast, compute_timings)
+    try:
+        print('%d weeks of history, %d projects per church, window %d' % (WEEKS, PROJECTS_PER_BRANCH, WINDOW))
+        for n_branches in sizes:
+            app, path = build_app(directory, n_branches)
+            client = app.test_client()
+            url = '/finances/forecast?as_of=%s&window=%d&horizon=%d' % (AS_OF, WINDOW, HORIZON)
+
+            response = client.get(url, headers=HEADERS)
+            assert response.status_code == 200, response.get_data()
+            forecast = response.get_json()
+            churches, projects = loop_forecast(path)
+            # Both sides agree on the numbers
+            assert len(forecast['churches']) == len(churches) and len(forecast['projects']) == len(projects)
+            for church, (church_id, balance, projected, donation_average, expense_average) in zip(forecast['churches'], churches):
+                assert abs(church['projected_balance'] - projected) < 0.01
+                assert all(abs(a - b) < 0.01 for a, b in zip(donation_average[::-1], church['donations_moving_average']))
+            for project, (project_id, remaining, rate, exhaustion, averages) in zip(forecast['projects'], projects):
+                assert abs(project['remaining'] - remaining) < 0.01
+                assert project['exhaustion_date'] == (str(exhaustion) if exhaustion else None)
+
+            del compute_timings[:]
+            endpoint = min(timeit.repeat(lambda: client.get(url, headers=HEADERS), number=3, repeat=3)) / 3
+            loop = min(timeit.repeat(lambda: loop_forecast(path), number=1, repeat=3))
+            print('%4d branches, %6d rows: endpoint %7.1f ms (NumPy pass %5.1f ms)  per-series loop %8.1f ms  speedup %.1fx' % (
+                n_branches, (n_branches + 1) * WEEKS * (DONATIONS_PER_WEEK + EXPENSES_PER_WEEK),
+                endpoint * 1000, min(compute_timings) * 1000, loop * 1000, loop / endpoint))
+            dispose_app(app)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
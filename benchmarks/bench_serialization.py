@@ -0,0 +1,47 @@
+# Micro-benchmark: hand-written index maps + jsonify vs. the serialization layer.
+# Run from the repository root: python benchmarks/bench_serialization.py [rows]
+import os
+import sqlite3
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+import serialization
+
+def build_db(n_rows):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE members (id INTEGER PRIMARY KEY, name TEXT, phone TEXT, address TEXT, church_id INTEGER)')
+    conn.executemany('INSERT INTO members (name, phone, address, church_id) VALUES (?, ?, ?, ?)',
+                     (('Member %d' % i, '+237 6%08d' % i, '%d Church Street' % i, i % 50) for i in range(n_rows)))
+    return conn
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    conn = build_db(n_rows)
+    app = Flask(__name__)
+
+    def index_map():
+        c = conn.execute('SELECT * FROM members')
+        rows = c.fetchall()
+        members = [{"id": r[0], "name": r[1], "phone": r[2], "address": r[3], "church_id": r[4]} for r in rows]
+        return jsonify(members).get_data()
+
+    def layer():
+        c = conn.execute('SELECT * FROM members')
+        return serialization.rows_response(c).get_data()
+
+    encoder = 'orjson' if serialization.orjson is not None else 'json (stdlib)'
+    print('%d rows, encoder: %s' % (n_rows, encoder))
+    with app.app_context():
+        assert len(index_map()) > 0 and len(layer()) > 0
+        results = {}
+        for name, func in (('index map + jsonify', index_map), ('serialization layer', layer)):
+            best = min(timeit.repeat(func, number=5, repeat=5)) / 5
+            results[name] = best
+            print('%-22s %8.2f ms/request' % (name, best * 1000))
+    print('speedup: %.2fx' % (results['index map + jsonify'] / results['serialization layer']))
+
+if __name__ == '__main__':
+    main()
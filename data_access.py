@@ -0,0 +1,228 @@
+import os
+import queue
+import shutil
+import sqlite3
+import tempfile
+import uuid
+from functools import lru_cache
+
+# Prepared statements are cached per connection, so connections are pooled
+# and reused instead of being opened for every request
+STATEMENT_CACHE_SIZE = 256
+POOL_SIZE = 8
+
+# Seconds SQLite itself waits on a locked database before raising; writes are
+# retried with backoff on top of this by the admission controller
+BUSY_TIMEOUT = 1.0
+
+class Storage:
+    """Where an app's database lives, from its DATABASE setting.
+
+    - a file path, e.g. 'database.db' (relative to the working directory)
+    - a 'file:' URI, passed to SQLite as is
+    - ':memory:', a private in-memory database shared by all connections of
+      this Storage through SQLite's shared cache
+    - ':temp:', a fresh temporary file, removed by close()
+    """
+
+    def __init__(self, database):
+        self.uri = False
+        self._anchor = None
+        self._temp_path = None
+        self._temp_dirs = []
+
+        if database == ':memory:':
+            # Unique name so every app gets its own database; it lives as long as one connection is open
+            self.database = 'file:memdb-%s?mode=memory&cache=shared' % uuid.uuid4().hex
+            self.uri = True
+            self._anchor = sqlite3.connect(self.database, uri=True, check_same_thread=False)
+        elif database == ':temp:':
+            fd, self._temp_path = tempfile.mkstemp(suffix='.db')
+            os.close(fd)
+            self.database = self._temp_path
+        else:
+            self.database = database
+            self.uri = database.startswith('file:')
+
+    def connect(self, factory=sqlite3.Connection, **kwargs):
+        kwargs.setdefault('timeout', BUSY_TIMEOUT)
+        kwargs.setdefault('cached_statements', STATEMENT_CACHE_SIZE)
+        return sqlite3.connect(self.database, factory=factory, uri=self.uri, **kwargs)
+
+    def sidecar_dir(self, suffix):
+        """Directory for files that belong with this database, e.g. cached results.
+
+        For a database file it is the file name plus suffix, next to it.
+        In-memory and temporary databases get a temporary directory that
+        close() removes along with the database.
+        """
+        if self._anchor is None and self._temp_path is None:
+            path = self.database
+            if self.uri:
+                path = path[len('file:'):].split('?', 1)[0]
+            if path and 'mode=memory' not in self.database:
+                return path + suffix
+        directory = tempfile.mkdtemp(suffix=suffix)
+        self._temp_dirs.append(directory)
+        return directory
+
+    def close(self):
+        for directory in self._temp_dirs:
+            shutil.rmtree(directory, ignore_errors=True)
+        self._temp_dirs = []
+        if self._anchor is not None:
+            self._anchor.close()
+            self._anchor = None
+        if self._temp_path is not None:
+            for suffix in ('', '-wal', '-shm', '-journal'):
+                try:
+                    os.remove(self._temp_path + suffix)
+                except FileNotFoundError:
+                    pass
+            self._temp_path = None
+
+class PooledConnection(sqlite3.Connection):
+    # close() hands the connection back to its pool instead of closing it
+    pool = None
+
+    def close(self):
+        if self.pool is None or not self.pool.release(self):
+            super().close()
+
+class ConnectionPool:
+    def __init__(self, storage, size=POOL_SIZE):
+        self.storage = storage
+        self.size = size
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            conn = self.storage.connect(factory=PooledConnection, check_same_thread=False)
+            conn.pool = self
+            return conn
+
+    def release(self, conn):
+        # Returns False if the connection should really be closed
+        if os.getpid() != self.pid:
+            return False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            # Handlers opt in to foreign keys per request; don't leak it to the next one
+            conn.execute('PRAGMA foreign_keys = OFF;')
+            self._idle.put_nowait(conn)
+            return True
+        except (queue.Full, sqlite3.Error):
+            return False
+
+    def clear(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.pool = None
+            conn.close()
+
+# --- Church scope ---
+
+def resolve_scope(c, user_role, associated_church_id, target_church_id=None):
+    """Return the list of church ids the caller may read.
+
+    Main church users get their own church and its branches, or just
+    target_church_id if it is one of those. Branch admins only get their own
+    church. Returns None if target_church_id is outside the caller's hierarchy.
+    """
+    if user_role != 'main_church':
+        return [int(associated_church_id)]
+
+    if target_church_id:
+        c.execute("SELECT id FROM churches WHERE id = ? AND (parent_id = ? OR id = ?)", (target_church_id, associated_church_id, associated_church_id))
+        row = c.fetchone()
+        return [row[0]] if row else None
+
+    c.execute("SELECT id FROM churches WHERE parent_id = ?", (associated_church_id,))
+    return [int(associated_church_id)] + [row[0] for row in c.fetchall()]
+
+# --- Query building ---
+
+def _placeholder_count(n):
+    # Round IN lists up to a power of two so a handful of statements covers every scope size
+    size = 1
+    while size < n:
+        size *= 2
+    return size
+
+def padded_ids(church_ids):
+    # church_ids padded to the placeholder count of in_placeholders()
+    n_placeholders = _placeholder_count(len(church_ids))
+    return list(church_ids) + [church_ids[-1]] * (n_placeholders - len(church_ids))
+
+def in_placeholders(church_ids):
+    # '?, ?, ...' for an IN list over church_ids, see scoped_select()
+    return ', '.join('?' * _placeholder_count(len(church_ids)))
+
+@lru_cache(maxsize=512)
+def _scoped_sql(source, columns, church_column, n_placeholders, filter_columns, suffix):
+    sql = "SELECT %s FROM %s WHERE %s IN (%s)" % (columns, source, church_column, ', '.join('?' * n_placeholders))
+    for column in filter_columns:
+        # 'column' means equality, 'column <op>' brings its own operator
+        sql += " AND %s ?" % column if ' ' in column else " AND %s = ?" % column
+    return sql + suffix
+
+def scoped_select(source, church_ids, columns='*', filters=None, church_column='church_id', suffix=''):
+    """Build a SELECT over source restricted to church_ids.
+
+    source is a table name or a FROM clause with joins, filters a list of
+    (column, value) or ('column <op>', value) pairs ANDed onto the scope
+    (e.g. ('project_id', 3) or ('date >=', '2025-01-01')) and suffix is appended as is
+    (GROUP BY / ORDER BY / LIMIT). Returns (sql, params).
+
+    The scope is an explicit IN list rather than an OR over a subquery so
+    SQLite can seek the church_id index, padded by repeating the last id so
+    the SQL text (and its cached prepared statement) is shared across scopes.
+    """
+    filters = filters or []
+    n_placeholders = _placeholder_count(len(church_ids))
+    params = padded_ids(church_ids) + [value for column, value in filters]
+    sql = _scoped_sql(source, columns, church_column, n_placeholders, tuple(column for column, value in filters), suffix)
+    return sql, params
+
+# --- Warmup ---
+
+SCOPED_TABLES = ('members', 'events', 'donations', 'attendance', 'projects', 'expenses')
+
+# Databases up to this size are read in full at warmup, bigger ones only their indexes
+WARM_SCAN_LIMIT = 64 * 1024 * 1024
+
+def warm_connection(conn, scan=True):
+    """Prepare the scoped list queries on conn so the first requests don't pay for it.
+
+    With scan, also read every index, and every table if the database is no
+    bigger than WARM_SCAN_LIMIT. That brings the file into the OS page cache,
+    which all connections and workers share; SQLite's own page cache is per
+    connection and only holds cache_size (about 2 MB by default), so a scan
+    is only worth doing from one connection.
+    """
+    c = conn.cursor()
+    if scan:
+        c.execute("PRAGMA page_count")
+        page_count = c.fetchone()[0]
+        c.execute("PRAGMA page_size")
+        size = page_count * c.fetchone()[0]
+
+        c.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")
+        for index, table in c.fetchall():
+            # COUNT(*) through the index walks all of its pages
+            c.execute('SELECT COUNT(*) FROM "%s" INDEXED BY "%s"' % (table, index))
+        if size <= WARM_SCAN_LIMIT:
+            c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+            for table in [row[0] for row in c.fetchall()]:
+                for row in c.execute('SELECT * FROM "%s"' % table):
+                    pass
+    for table in SCOPED_TABLES:
+        c.execute(*scoped_select(table, [0]))
+        c.fetchall()
@@ -1,18 +1,34 @@
+import os
 import sqlite3
+import sys
+import uuid
 
-def init_db():
-    conn = sqlite3.connect('database.db')
+def default_path():
+    # The database the app uses by default (its DATABASE setting)
+    return os.environ.get('DATABASE', 'database.db')
+
+# Creates the schema from scratch, dropping existing tables. Works on the given
+# connection (left open), or opens path, by default default_path(); a
+# 'file:' URI is passed to SQLite as is.
+def init_db(conn=None, path=None):
+    own_conn = conn is None
+    if own_conn:
+        path = path or default_path()
+        conn = sqlite3.connect(path, uri=path.startswith('file:'))
 
     # Enable foreign key support
     conn.execute('PRAGMA foreign_keys = ON;')
     c = conn.cursor()
 
     # Drop existing tables if they exist (for development simplicity)
+    c.execute('DROP TABLE IF EXISTS db_meta;')
+    c.execute('DROP TABLE IF EXISTS change_log;')
     c.execute('DROP TABLE IF EXISTS projects;')
     c.execute('DROP TABLE IF EXISTS expenses;')
     c.execute('DROP TABLE IF EXISTS messages;')
     c.execute('DROP TABLE IF EXISTS attendance;')
     c.execute('DROP TABLE IF EXISTS donations;')
+    c.execute('DROP TABLE IF EXISTS donors;')
     c.execute('DROP TABLE IF EXISTS events;')
     c.execute('DROP TABLE IF EXISTS members;')
     c.execute('DROP TABLE IF EXISTS users;')
@@ -64,6 +80,15 @@ def init_db():
         )
     ''')
 
+    # Create donors table (one row per normalized donor name)
+    c.execute('''
+        CREATE TABLE donors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            normalized_name TEXT NOT NULL UNIQUE
+        )
+    ''')
+
     # Create donations table
     c.execute('''
         CREATE TABLE donations (
@@ -73,7 +98,9 @@ def init_db():
             date TEXT NOT NULL,
             type TEXT, -- e.g., 'tithe', 'offering'
             church_id INTEGER NOT NULL,
-            FOREIGN KEY (church_id) REFERENCES churches (id) ON DELETE CASCADE
+            donor_id INTEGER,
+            FOREIGN KEY (church_id) REFERENCES churches (id) ON DELETE CASCADE,
+            FOREIGN KEY (donor_id) REFERENCES donors (id) ON DELETE SET NULL
         )
     ''')
 
@@ -128,8 +155,143 @@ def init_db():
         )
     ''')
 
+    upgrade_db(conn)
+
+    conn.commit()
+    if own_conn:
+        conn.close()
+
+# Bootstraps an empty database with init_db, otherwise brings it up to date
+def ensure_schema(conn):
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'churches'")
+    if c.fetchone():
+        upgrade_db(conn)
+    else:
+        init_db(conn)
+
+# Idempotent schema additions, safe to run against an existing database
+def upgrade_db(conn):
+    c = conn.cursor()
+
+    # WAL lets readers, including online backups, run alongside the writer
+    c.execute('PRAGMA journal_mode = WAL')
+
+    # Project spending is aggregated by joining expenses on project_id
+    c.execute('CREATE INDEX IF NOT EXISTS idx_expenses_project_id ON expenses (project_id)')
+
+    # Hierarchy reads resolve a church's branches, then seek each table by church_id
+    c.execute('CREATE INDEX IF NOT EXISTS idx_churches_parent_id ON churches (parent_id)')
+    for table in ('members', 'events', 'donations', 'attendance', 'projects', 'expenses'):
+        c.execute('CREATE INDEX IF NOT EXISTS idx_%s_church_id ON %s (church_id)' % (table, table))
+
+    # Conversations are paged by id within each (sender, receiver) direction
+    c.execute('CREATE INDEX IF NOT EXISTS idx_messages_pair ON messages (sender_church_id, receiver_church_id, id)')
+
+    # Donations link to a normalized donor; databases created before the
+    # donors table get it here and have their free-text names backfilled
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS donors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            normalized_name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    c.execute('PRAGMA table_info(donations)')
+    if 'donor_id' not in [column[1] for column in c.fetchall()]:
+        c.execute('ALTER TABLE donations ADD COLUMN donor_id INTEGER REFERENCES donors (id) ON DELETE SET NULL')
+        # Names are normalized in Python, so map each distinct name to its
+        # donor in a keyed temp table and link all donations in one pass
+        c.execute('CREATE TEMP TABLE donor_names (donor_name TEXT PRIMARY KEY, donor_id INTEGER)')
+        c.execute('SELECT DISTINCT donor_name FROM donations WHERE donor_name IS NOT NULL')
+        names = [(donor_name, get_or_create_donor(c, donor_name)) for (donor_name,) in c.fetchall()]
+        c.executemany('INSERT INTO temp.donor_names (donor_name, donor_id) VALUES (?, ?)', names)
+        c.execute('''
+            UPDATE donations SET donor_id = (SELECT donor_id FROM temp.donor_names WHERE donor_names.donor_name = donations.donor_name)
+            WHERE donor_name IS NOT NULL
+        ''')
+        c.execute('DROP TABLE temp.donor_names')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_donations_church_date ON donations (church_id, date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_donations_donor_id ON donations (donor_id)')
+
+    # Change log for delta sync, filled by triggers. Messages are logged under
+    # the sender with the receiver as peer_church_id.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL, -- 'insert', 'update' or 'delete'
+            church_id INTEGER NOT NULL,
+            peer_church_id INTEGER,
+            changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_change_log_church_seq ON change_log (church_id, seq)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_change_log_peer_seq ON change_log (peer_church_id, seq)')
+
+    for table, church_column, peer_column in CHANGE_LOG_TABLES:
+        for op, row in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            peer = '%s.%s' % (row, peer_column) if peer_column else 'NULL'
+            c.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_%(table)s_%(op)s AFTER %(event)s ON %(table)s
+                BEGIN
+                    INSERT INTO change_log (table_name, row_id, op, church_id, peer_church_id)
+                    VALUES ('%(table)s', %(row)s.id, '%(op)s', %(row)s.%(church)s, %(peer)s);
+                END
+            ''' % {'table': table, 'op': op, 'event': op.upper(), 'row': row, 'church': church_column, 'peer': peer})
+
+        # A row moved to another church disappears from the old church's view
+        peer = 'OLD.%s' % peer_column if peer_column else 'NULL'
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_%(table)s_move AFTER UPDATE OF %(church)s ON %(table)s
+            WHEN OLD.%(church)s != NEW.%(church)s
+            BEGIN
+                INSERT INTO change_log (table_name, row_id, op, church_id, peer_church_id)
+                VALUES ('%(table)s', OLD.id, 'delete', OLD.%(church)s, %(peer)s);
+            END
+        ''' % {'table': table, 'church': church_column, 'peer': peer})
+
+    # A fresh database gets its generation id here; see new_generation()
+    c.execute('CREATE TABLE IF NOT EXISTS db_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    c.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES ('generation', ?)", (uuid.uuid4().hex,))
+
     conn.commit()
-    conn.close()
+
+# Give the database a new generation id. Restores and resets move change_log
+# back, so its sequence numbers get reused; anything cached against them is
+# also keyed on the generation and so never mistaken for current data.
+def new_generation(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS db_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    conn.execute("INSERT OR REPLACE INTO db_meta (key, value) VALUES ('generation', ?)", (uuid.uuid4().hex,))
+    conn.commit()
+
+def normalize_donor_name(name):
+    # Case and whitespace insensitive key, so 'John  Smith' and 'john smith' are one donor
+    return ' '.join(name.split()).casefold()
+
+# Returns the donors.id for name, creating the donor if needed (None for blank names)
+def get_or_create_donor(c, name):
+    if not name or not name.strip():
+        return None
+    normalized_name = normalize_donor_name(name)
+    c.execute('INSERT OR IGNORE INTO donors (name, normalized_name) VALUES (?, ?)', (' '.join(name.split()), normalized_name))
+    c.execute('SELECT id FROM donors WHERE normalized_name = ?', (normalized_name,))
+    return c.fetchone()[0]
+
+# (table, church column, peer church column) of every table tracked in change_log
+CHANGE_LOG_TABLES = (
+    ('members', 'church_id', None),
+    ('events', 'church_id', None),
+    ('donations', 'church_id', None),
+    ('attendance', 'church_id', None),
+    ('projects', 'church_id', None),
+    ('expenses', 'church_id', None),
+    ('messages', 'sender_church_id', 'receiver_church_id')
+)
 
 if __name__ == '__main__':
-    init_db()
+    # python database.py [path]: recreate the schema, by default of $DATABASE
+    path = sys.argv[1] if len(sys.argv) > 1 else default_path()
+    init_db(path=path)
+    print('Initialized %s' % path)
@@ -0,0 +1,38 @@
+# Production configuration: gunicorn -c gunicorn.conf.py
+import multiprocessing
+import os
+
+wsgi_app = 'app:create_app()'
+
+bind = os.environ.get('BIND', '0.0.0.0:%s' % os.environ.get('PORT', '8888'))
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+# SQLite releases the GIL while it works, so threaded workers overlap I/O and
+# queries well. One process per CPU keeps every core busy without piling up
+# writers on the single database lock.
+worker_class = os.environ.get('WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('THREADS', 4))
+
+# Only used by the gevent worker class. sqlite3 calls are not cooperative, so
+# keep this low enough that one slow query doesn't stall too many clients.
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 100))
+
+timeout = int(os.environ.get('TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to bound memory growth from caches
+max_requests = int(os.environ.get('MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+
+def post_fork(server, worker):
+    # Fresh connection pool and caches in every worker, then warm them up.
+    # With preload_app this returns the app the master already created.
+    from app import init_worker
+    init_worker(worker.app.wsgi())
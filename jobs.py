@@ -0,0 +1,245 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import reports
+import serialization
+
+# Hierarchy-wide reports can take tens of seconds, so they run on a small
+# thread pool in the web worker instead of inside the request. Job records
+# and results live on disk, so any worker process can answer for any job,
+# and results are reused for as long as the data they were built from.
+WORKERS = 2
+MAX_PENDING = 32
+# Results and job records older than this are removed
+RESULT_TTL = 24 * 3600
+PRUNE_INTERVAL = 600
+
+REPORTS = {
+    'finance_totals': reports.finance_totals,
+    'rollup': reports.rollup,
+    'export': reports.export
+}
+
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+class JobQueueFull(Exception):
+    pass
+
+def data_version(c):
+    """Everything a cached report depends on besides its parameters and scope.
+
+    Every write to the church-scoped tables adds a change_log entry, so its
+    last sequence number changes whenever report data may have; churches
+    aren't logged, so their names and hierarchy are included as they are.
+    The generation id tells databases apart, including a database from its
+    own earlier state after a restore or reset, which reuses sequence numbers.
+    """
+    c.execute("SELECT value FROM db_meta WHERE key = 'generation'")
+    generation = c.fetchone()[0]
+    c.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log")
+    seq = c.fetchone()[0]
+    c.execute("SELECT id, name, parent_id FROM churches ORDER BY id")
+    churches = hashlib.sha256(repr(c.fetchall()).encode('utf-8')).hexdigest()
+    return [generation, seq, churches]
+
+def cache_key(kind, params, church_ids, version):
+    key = json.dumps([kind, params, sorted(church_ids), version], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def _write_atomic(path, data):
+    # Readers in other processes see either the old file or the new one, never half of it
+    tmp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class JobQueue:
+    """Report jobs of one app in one process.
+
+    connect() returns a database connection for a job; it is closed when the
+    job is done. Jobs are kept under directory as jobs/<id>.json and their
+    results as results/<cache key>.json.
+    """
+
+    def __init__(self, directory, connect, workers=WORKERS, max_pending=MAX_PENDING, result_ttl=RESULT_TTL):
+        self.pid = os.getpid()
+        self.connect = connect
+        self.workers = workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.jobs_dir = os.path.join(directory, 'jobs')
+        self.results_dir = os.path.join(directory, 'results')
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        os.makedirs(self.results_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='report-job')
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'cache_hits': 0,
+            'pending': 0,
+            'rejected': 0,
+            'run_seconds_total': 0.0,
+            'run_seconds_max': 0.0
+        }
+
+    def submit(self, kind, params, church_ids, owner, version):
+        """Queue a report and return its job record.
+
+        version is data_version() at submit time; if a result for it is
+        already cached the job is done right away and never queued.
+        """
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'params': params,
+            'church_ids': list(church_ids),
+            'owner': str(owner),
+            'pid': self.pid,
+            'status': 'queued',
+            'cached': False,
+            'error': None,
+            'result_key': None,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None
+        }
+        self._maybe_prune()
+
+        key = cache_key(kind, params, church_ids, version)
+        path = self._result_path(key)
+        if os.path.exists(path):
+            # Keep results that are still being asked for
+            os.utime(path)
+            with self._lock:
+                self._stats['submitted'] += 1
+                self._stats['cache_hits'] += 1
+            job.update(status='done', cached=True, result_key=key, started_at=job['created_at'], finished_at=job['created_at'])
+            self._save(job)
+            return job
+
+        with self._lock:
+            if self._stats['pending'] >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise JobQueueFull('Too many report jobs in progress')
+            self._stats['submitted'] += 1
+            self._stats['pending'] += 1
+        self._save(job)
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        # The job record, or None for unknown ids
+        if not JOB_ID.match(job_id):
+            return None
+        try:
+            with open(self._job_path(job_id), 'rb') as f:
+                job = json.loads(f.read())
+        except FileNotFoundError:
+            return None
+        # A job whose worker process died is never going to finish
+        if job['status'] in ('queued', 'running') and job['pid'] != self.pid and not _pid_alive(job['pid']):
+            job.update(status='failed', error='Worker exited before the job finished')
+        return job
+
+    def response_body(self, job):
+        """JSON bytes of the job record, with the result once it is done.
+
+        The cached result is spliced in as stored, so large reports aren't
+        decoded and encoded again for every poll.
+        """
+        public = {k: v for k, v in job.items() if k not in ('owner', 'pid', 'result_key')}
+        body = serialization.dumps(public)
+        if job['status'] != 'done':
+            return body
+        try:
+            with open(self._result_path(job['result_key']), 'rb') as f:
+                result = f.read()
+        except FileNotFoundError:
+            public.update(status='expired', error='The result has been removed, please submit the job again')
+            return serialization.dumps(public)
+        return body[:-1] + b',"result":' + result + b'}'
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        finished = stats['completed'] + stats['failed']
+        stats['run_seconds_avg'] = stats['run_seconds_total'] / finished if finished else 0.0
+        stats.update({'workers': self.workers, 'max_pending': self.max_pending})
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job):
+        job.update(status='running', started_at=time.time())
+        self._save(job)
+        try:
+            conn = self.connect()
+            try:
+                c = conn.cursor()
+                # One read transaction: the version and the report see the same snapshot
+                c.execute('BEGIN')
+                key = cache_key(job['kind'], job['params'], job['church_ids'], data_version(c))
+                path = self._result_path(key)
+                # An identical job may have finished while this one was queued
+                if not os.path.exists(path):
+                    result = REPORTS[job['kind']](c, job['church_ids'], job['params'])
+                    _write_atomic(path, serialization.dumps(result))
+                else:
+                    job['cached'] = True
+            finally:
+                conn.close()
+            job.update(status='done', result_key=key)
+        except Exception as e:
+            job.update(status='failed', error=str(e))
+        job['finished_at'] = time.time()
+        self._save(job)
+
+        elapsed = job['finished_at'] - job['started_at']
+        with self._lock:
+            self._stats['pending'] -= 1
+            self._stats['completed' if job['status'] == 'done' else 'failed'] += 1
+            self._stats['run_seconds_total'] += elapsed
+            self._stats['run_seconds_max'] = max(self._stats['run_seconds_max'], elapsed)
+
+    def _maybe_prune(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_prune < PRUNE_INTERVAL:
+                return
+            self._last_prune = now
+        cutoff = now - self.result_ttl
+        for directory in (self.jobs_dir, self.results_dir):
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _save(self, job):
+        _write_atomic(self._job_path(job['id']), serialization.dumps(job))
+
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, job_id + '.json')
+
+    def _result_path(self, key):
+        return os.path.join(self.results_dir, key + '.json')
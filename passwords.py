@@ -0,0 +1,128 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+# Hashing is deliberately slow, so it runs in a small process pool instead of
+# on the request threads. Every web worker has its own pool, so one hashing
+# process each already matches gunicorn's one worker per CPU.
+# HASH_WORKERS=0 hashes inline.
+HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 1))
+MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 64))
+QUEUE_TIMEOUT = 10.0
+
+class HashQueueFull(Exception):
+    pass
+
+def _normalize_method(method):
+    # Spell out werkzeug's defaults so the method can be compared with stored hashes
+    parts = method.split(':')
+    if parts[0] == 'scrypt' and len(parts) == 1:
+        return 'scrypt:32768:8:1'
+    if parts[0] == 'pbkdf2':
+        if len(parts) == 1:
+            parts.append('sha256')
+        if len(parts) == 2:
+            parts.append(str(DEFAULT_PBKDF2_ITERATIONS))
+    return ':'.join(parts)
+
+HASH_METHOD = _normalize_method(HASH_METHOD)
+
+# Run in the pool processes; also return when the job started to measure queue time
+def _generate(password, method, salt_length):
+    return time.time(), generate_password_hash(password, method=method, salt_length=salt_length)
+
+def _check(pwhash, password):
+    return time.time(), check_password_hash(pwhash, password)
+
+class HashPool:
+    # Bounded queue in front of a pool of hashing processes (hashes inline if workers is 0)
+    def __init__(self, workers=HASH_WORKERS, max_pending=MAX_PENDING):
+        self.pid = os.getpid()
+        self.workers = workers
+        self.max_pending = max_pending
+        # spawn, not fork: the web worker is multi-threaded
+        self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) if workers else None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'pending': 0,
+            'rejected': 0,
+            'queue_seconds_total': 0.0,
+            'queue_seconds_max': 0.0,
+            'run_seconds_total': 0.0
+        }
+
+    def run(self, func, *args):
+        if not self._slots.acquire(timeout=QUEUE_TIMEOUT):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise HashQueueFull('Too many password operations in progress')
+        try:
+            with self._lock:
+                self._stats['submitted'] += 1
+                self._stats['pending'] += 1
+            submitted = time.time()
+            if self._executor is None:
+                started, result = func(*args)
+            else:
+                started, result = self._executor.submit(func, *args).result()
+            finished = time.time()
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._stats['pending'] -= 1
+
+        queued = max(0.0, started - submitted)
+        with self._lock:
+            self._stats['completed'] += 1
+            self._stats['queue_seconds_total'] += queued
+            self._stats['queue_seconds_max'] = max(self._stats['queue_seconds_max'], queued)
+            self._stats['run_seconds_total'] += finished - started
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        completed = stats['completed']
+        stats['queue_seconds_avg'] = stats['queue_seconds_total'] / completed if completed else 0.0
+        stats.update({'workers': self.workers, 'max_pending': self.max_pending, 'method': HASH_METHOD})
+        return stats
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    # Default pool, one per process, for callers that don't bring their own
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = HashPool()
+        return _pool
+
+def hash_password(password, pool=None):
+    return (pool or _get_pool()).run(_generate, password, HASH_METHOD, SALT_LENGTH)
+
+def verify_password(pwhash, password, pool=None):
+    return (pool or _get_pool()).run(_check, pwhash, password)
+
+def needs_rehash(pwhash):
+    # True if the hash was made with another method or salt length than the current ones
+    parts = pwhash.split('$', 2)
+    if len(parts) != 3:
+        return True
+    method, salt, _ = parts
+    return method != HASH_METHOD or len(salt) != SALT_LENGTH
+
+def metrics(pool=None):
+    return (pool or _get_pool()).metrics()
@@ -0,0 +1,120 @@
+import csv
+import io
+import data_access
+import serialization
+
+# Rows are pulled from SQLite and written out this many at a time
+CHUNK_SIZE = 500
+
+def giving_statements(c, church_ids, year):
+    """Execute the annual giving statement query for church_ids on cursor c.
+
+    One grouped pass over the year's donations gives every donor's total,
+    count and first/last gift across the whole scope; donations without a
+    donor are left out. Rows are left on the cursor to be streamed.
+    """
+    c.execute(*data_access.scoped_select(
+        "donations d JOIN donors dn ON dn.id = d.donor_id",
+        church_ids,
+        columns="""d.donor_id, dn.name AS donor_name, %d AS year,
+                   COUNT(*) AS donation_count, SUM(d.amount) AS total_amount,
+                   MIN(d.date) AS first_donation_date, MAX(d.date) AS last_donation_date""" % year,
+        filters=[('d.date >=', '%04d-01-01' % year), ('d.date <', '%04d-01-01' % (year + 1))],
+        church_column="d.church_id",
+        suffix=" GROUP BY d.donor_id ORDER BY dn.normalized_name"))
+    return c
+
+def _chunks(c):
+    while True:
+        rows = c.fetchmany(CHUNK_SIZE)
+        if not rows:
+            break
+        yield rows
+
+def stream_csv(c):
+    # Header line, then one encoded chunk of rows at a time
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(serialization.column_names(c))
+    for rows in _chunks(c):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def stream_ndjson(c):
+    build = serialization.row_builder(serialization.column_names(c))
+    for rows in _chunks(c):
+        yield b''.join(serialization.dumps(row) + b'\n' for row in build(rows))
+
+# --- Hierarchy reports (run as background jobs, see jobs.py) ---
+
+def _date_filters(column, params):
+    # Optional 'year' parameter restricting column to that calendar year
+    year = params.get('year')
+    if year is None:
+        return '', []
+    year = int(year)
+    return ' AND %s >= ? AND %s < ?' % (column, column), ['%04d-01-01' % year, '%04d-01-01' % (year + 1)]
+
+def _per_church(c, church_ids, aggregates, params):
+    """One row per church in church_ids with one LEFT JOINed grouped aggregate per entry.
+
+    aggregates is a list of (name, table, expression, date column or None);
+    each becomes a single GROUP BY church_id pass over its table.
+    """
+    placeholders = data_access.in_placeholders(church_ids)
+    ids = data_access.padded_ids(church_ids)
+
+    columns = ['ch.id AS church_id', 'ch.name AS church_name']
+    joins = []
+    query_params = []
+    for name, table, expression, date_column in aggregates:
+        date_sql, date_params = _date_filters(date_column, params) if date_column else ('', [])
+        joins.append("LEFT JOIN (SELECT church_id, %s AS value FROM %s WHERE church_id IN (%s)%s GROUP BY church_id) %s ON %s.church_id = ch.id"
+                     % (expression, table, placeholders, date_sql, name, name))
+        query_params += ids + date_params
+        columns.append('COALESCE(%s.value, 0) AS %s' % (name, name))
+
+    c.execute("SELECT %s FROM churches ch %s WHERE ch.id IN (%s) ORDER BY ch.id"
+              % (', '.join(columns), ' '.join(joins), placeholders), query_params + ids)
+    return serialization.rows_to_dicts(c)
+
+def finance_totals(c, church_ids, params):
+    # Donations, expenses and balance per church, optionally for one year
+    rows = _per_church(c, church_ids, [
+        ('total_donations', 'donations', 'SUM(amount)', 'date'),
+        ('total_expenses', 'expenses', 'SUM(amount)', 'date')
+    ], params)
+    for row in rows:
+        # Churches without donations or expenses get 0 from COALESCE; keep every amount a float
+        row['total_donations'], row['total_expenses'] = float(row['total_donations']), float(row['total_expenses'])
+        row['total_balance'] = row['total_donations'] - row['total_expenses']
+    return {'churches': rows, 'total_balance': sum(row['total_balance'] for row in rows)}
+
+def rollup(c, church_ids, params):
+    # Headline numbers per church and for the whole scope
+    rows = _per_church(c, church_ids, [
+        ('members', 'members', 'COUNT(*)', None),
+        ('events', 'events', 'COUNT(*)', 'date'),
+        ('attendance', 'attendance', 'SUM(member_count)', 'date'),
+        ('donations', 'donations', 'SUM(amount)', 'date'),
+        ('expenses', 'expenses', 'SUM(amount)', 'date'),
+        ('project_budgets', 'projects', 'SUM(budget)', None)
+    ], params)
+    totals = {}
+    for row in rows:
+        for key, value in row.items():
+            if key not in ('church_id', 'church_name'):
+                totals[key] = totals.get(key, 0) + value
+    return {'churches': rows, 'totals': totals}
+
+def export(c, church_ids, params):
+    # All rows of one church-scoped table
+    table = params.get('table')
+    if table not in data_access.SCOPED_TABLES:
+        raise ValueError('table must be one of: %s' % ', '.join(data_access.SCOPED_TABLES))
+    c.execute(*data_access.scoped_select(table, church_ids, suffix=' ORDER BY id'))
+    return {'table': table, 'rows': serialization.rows_to_dicts(c)}
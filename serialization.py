@@ -0,0 +1,47 @@
+import json
+from functools import lru_cache
+from flask import Response
+
+# orjson (in requirements.txt) encodes dicts of SQLite values several times
+# faster than the stdlib encoder and returns bytes directly; without it the
+# stdlib encoder gives the same output
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, check_circular=False)
+
+def column_names(cursor):
+    # Column names of the last query, in select order
+    return tuple(column[0] for column in cursor.description)
+
+@lru_cache(maxsize=256)
+def row_builder(names):
+    """Return a function turning a sequence of rows into a list of dicts.
+
+    The function is generated once per column tuple and is equivalent to the
+    hand-written {"id": r[0], ...} comprehensions, so there is no per-row
+    zip() or key lookup.
+    """
+    items = ', '.join('%r: r[%d]' % (name, i) for i, name in enumerate(names))
+    namespace = {}
+    exec('def build(rows):\n    return [{%s} for r in rows]' % items, namespace)
+    return namespace['build']
+
+def rows_to_dicts(cursor, rows=None):
+    # rows defaults to the remaining rows of cursor
+    return row_builder(column_names(cursor))(cursor if rows is None else rows)
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return _encoder.encode(obj).encode('utf-8')
+
+def json_response(obj, status=200):
+    # Same content type as jsonify, without key sorting
+    return Response(dumps(obj), status=status, mimetype='application/json')
+
+def rows_response(cursor, rows=None, status=200):
+    # Encode the result set of cursor (or the given rows) as a JSON array of objects
+    return json_response(rows_to_dicts(cursor, rows), status)
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cheap hashes keep registration fast; must be set before passwords is imported
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+
+from app import connect_db, create_app, dispose_app
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({'DATABASE': ':memory:', 'PASSWORD_HASH_WORKERS': 0, 'JOB_DIR': str(tmp_path / 'jobs')})
+    yield app
+    dispose_app(app)
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def register(client, name='Main', email='main@example.com', password='secret'):
+    # Register a main church and return the auth headers of its user
+    assert client.post('/register', json={'church_name': name, 'email': email, 'password': password}).status_code == 200
+    user = client.post('/login', json={'email': email, 'password': password}).get_json()
+    return {'User-Id': str(user['user_id']), 'User-Role': user['role'], 'Associated-Church-Id': str(user['associated_church_id'])}
+
+@pytest.fixture
+def headers(client):
+    return register(client)
+
+def execute(app, sql, params=()):
+    # Run one statement directly against the app's database and commit it
+    conn = connect_db(app=app)
+    try:
+        cursor = conn.execute(sql, params)
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        conn.close()
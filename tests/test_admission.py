@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+
+def test_one_tenant_queues_instead_of_failing():
+    controller = AdmissionController(slots=1, max_queue=64, per_tenant_limit=2)
+    failures = []
+
+    def write():
+        for _ in range(10):
+            try:
+                controller.acquire('church-1')
+            except Overloaded as e:
+                failures.append(e)
+                continue
+            time.sleep(0.001)
+            controller.release('church-1')
+
+    threads = [threading.Thread(target=write) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+    metrics = controller.metrics()
+    assert metrics['admitted'] == 80 and metrics['active'] == 0 and metrics['queue_depth'] == 0
+
+def _queue_in_background(controller, tenant, results):
+    def run():
+        try:
+            controller.acquire(tenant)
+        except Overloaded as e:
+            results.append((tenant, str(e)))
+            return
+        results.append((tenant, 'granted'))
+        controller.release(tenant)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.05)
+    return thread
+
+def test_full_queue_sheds_the_heaviest_tenant():
+    controller = AdmissionController(slots=1, max_queue=2, per_tenant_limit=1, max_wait=5)
+    controller.acquire('busy')
+    results = []
+    threads = [_queue_in_background(controller, 'busy', results) for _ in range(2)]
+
+    # The queue is full of 'busy'; a quiet tenant takes the place of its newest request
+    threads.append(_queue_in_background(controller, 'quiet', results))
+    assert results == [('busy', 'Write queue is full')]
+
+    # And 'busy' itself gets no further in
+    with pytest.raises(Overloaded):
+        controller.acquire('busy')
+
+    controller.release('busy')
+    for thread in threads:
+        thread.join()
+    assert sorted(results[1:]) == [('busy', 'granted'), ('quiet', 'granted')]
+    assert controller.metrics()['evicted'] == 1
+
+def test_round_robin_across_tenants():
+    controller = AdmissionController(slots=1, max_queue=10, per_tenant_limit=4, max_wait=5)
+    controller.acquire('a')
+    results = []
+    threads = [_queue_in_background(controller, tenant, results) for tenant in ('a', 'a', 'b')]
+    controller.release('a')
+    for thread in threads:
+        thread.join()
+    assert [tenant for tenant, outcome in results] == ['a', 'b', 'a']
+
+def test_wait_times_out():
+    controller = AdmissionController(slots=1, max_wait=0.05)
+    controller.acquire('a')
+    with pytest.raises(Overloaded, match='Timed out'):
+        controller.acquire('b')
+    controller.release('a')
+    assert controller.metrics()['timed_out'] == 1
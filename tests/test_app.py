@@ -0,0 +1,108 @@
+import admission
+import database
+from app import _hash_pool, connect_db, create_app, dispose_app
+
+from conftest import execute, register
+
+def test_health(client):
+    assert client.get('/health').get_json() == {'status': 'ok'}
+
+def test_apps_are_isolated(tmp_path):
+    first = create_app({'DATABASE': ':memory:', 'PASSWORD_HASH_WORKERS': 0, 'JOB_DIR': str(tmp_path / 'first')})
+    second = create_app({'DATABASE': ':memory:', 'PASSWORD_HASH_WORKERS': 0, 'JOB_DIR': str(tmp_path / 'second')})
+    try:
+        headers = register(first.test_client())
+        first.test_client().post('/members', json={'name': 'Ada'}, headers=headers)
+
+        assert [m['name'] for m in first.test_client().get('/members', headers=headers).get_json()] == ['Ada']
+        assert second.test_client().post('/login', json={'email': 'main@example.com', 'password': 'secret'}).status_code == 401
+
+        with first.app_context(), second.app_context():
+            assert admission.controller_for(first) is not admission.controller_for(second)
+            assert _hash_pool(first) is not _hash_pool(second)
+        assert admission.controller_for(first).metrics()['admitted'] > 0
+        assert admission.controller_for(second).metrics()['admitted'] == 0
+    finally:
+        dispose_app(first)
+        dispose_app(second)
+
+def test_finances_total_search(client, app, headers):
+    north = client.post('/churches', json={'name': 'North'}, headers=headers).get_json()['church_id']
+    client.post('/churches', json={'name': 'South'}, headers=headers)
+    execute(app, "INSERT INTO donations (amount, donor_name, date, type, church_id) VALUES (100, 'D', '2025-01-05', 'cash', ?)", (north,))
+    execute(app, "INSERT INTO expenses (description, amount, date, church_id) VALUES ('Rent', 30, '2025-01-06', ?)", (north,))
+
+    totals = client.get('/finances/total', headers=headers).get_json()
+    assert [row['church_name'] for row in totals] == ['Main', 'North', 'South']
+    assert client.get('/finances/total?search_term=orth', headers=headers).get_json() == [
+        {'church_id': north, 'church_name': 'North', 'total_balance': 70.0}
+    ]
+
+def test_message_paging(client, headers):
+    branch = client.post('/churches', json={'name': 'North'}, headers=headers).get_json()['church_id']
+    for i in range(5):
+        client.post('/messages', json={'receiver_church_id': branch, 'message_content': 'm%d' % i}, headers=headers)
+
+    latest = client.get('/messages/%d?limit=2' % branch, headers=headers)
+    assert [m['message_content'] for m in latest.get_json()] == ['m3', 'm4']
+    assert latest.headers['X-Has-More'] == 'true'
+
+    older = client.get('/messages/%d?limit=2&before_id=%d' % (branch, latest.get_json()[0]['id']), headers=headers)
+    assert [m['message_content'] for m in older.get_json()] == ['m1', 'm2']
+
+    newer = client.get('/messages/%d?after_id=%d' % (branch, older.get_json()[-1]['id']), headers=headers)
+    assert [m['message_content'] for m in newer.get_json()] == ['m3', 'm4']
+    assert newer.headers['X-Has-More'] == 'false'
+
+    for query in ('before_id=abc', 'after_id=x', 'limit=z', 'limit=0'):
+        assert client.get('/messages/%d?%s' % (branch, query), headers=headers).status_code == 400
+
+def test_message_to_self_is_returned_once(client, headers):
+    me = int(headers['Associated-Church-Id'])
+    client.post('/messages', json={'receiver_church_id': me, 'message_content': 'note'}, headers=headers)
+    assert [m['message_content'] for m in client.get('/messages/%d' % me, headers=headers).get_json()] == ['note']
+    assert [m['message_content'] for m in client.get('/messages/%d?after_id=0' % me, headers=headers).get_json()] == ['note']
+
+def test_sync(client, app, headers):
+    head = client.get('/sync', headers=headers).get_json()
+    assert head['changes'] == []
+
+    client.post('/members', json={'name': 'Ada'}, headers=headers)
+    member_id = client.get('/members', headers=headers).get_json()[0]['id']
+    page = client.get('/sync?since=%d' % head['next_since'], headers=headers).get_json()
+    assert [(c['table'], c['op'], c['data']['name']) for c in page['changes']] == [('members', 'insert', 'Ada')]
+
+    execute(app, "DELETE FROM members WHERE id = ?", (member_id,))
+    page = client.get('/sync?since=%d' % page['next_since'], headers=headers).get_json()
+    assert [(c['table'], c['op'], c['id'], c['data']) for c in page['changes']] == [('members', 'delete', member_id, None)]
+
+    assert client.get('/sync?since=abc', headers=headers).status_code == 400
+
+def test_sync_hides_other_hierarchies(client, headers):
+    other = register(client, name='Other', email='other@example.com')
+    since = client.get('/sync', headers=headers).get_json()['next_since']
+    client.post('/members', json={'name': 'Elsewhere'}, headers=other)
+    assert client.get('/sync?since=%d' % since, headers=headers).get_json()['changes'] == []
+
+def test_sync_cursor_from_another_generation(client, app, headers):
+    head = client.get('/sync', headers=headers).get_json()
+    client.post('/members', json={'name': 'Ada'}, headers=headers)
+    page = client.get('/sync?since=%d&generation=%s' % (head['next_since'], head['generation']), headers=headers).get_json()
+    assert page['generation'] == head['generation'] and len(page['changes']) == 1
+
+    conn = connect_db(app=app)
+    database.new_generation(conn)
+    conn.close()
+    response = client.get('/sync?since=%d&generation=%s' % (page['next_since'], page['generation']), headers=headers)
+    assert response.status_code == 410
+    assert response.get_json()['generation'] != head['generation']
+
+    # A cursor past the end of change_log was handed out before it was rewound
+    assert client.get('/sync?since=%d' % (page['next_since'] + 100), headers=headers).status_code == 410
+
+def test_church_id_header_must_be_an_integer(client, headers):
+    for value in ('abc', '1.5', '\u00b2'):
+        bad = dict(headers, **{'Associated-Church-Id': value})
+        for path in ('/members', '/donations', '/finances/total', '/sync'):
+            response = client.get(path, headers=bad)
+            assert response.status_code == 401 and response.get_json() == {'error': 'Associated-Church-Id must be an integer!'}
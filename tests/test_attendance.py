@@ -0,0 +1,59 @@
+from conftest import execute
+
+def record(client, headers, event_id, count, date):
+    response = client.post('/attendance', json={'event_id': event_id, 'member_count': count, 'date': date}, headers=headers)
+    assert response.status_code == 201
+
+def add_event(client, headers, title='Service'):
+    assert client.post('/events', json={'title': title, 'date': '2025-01-05'}, headers=headers).status_code == 201
+    return [e for e in client.get('/events', headers=headers).get_json() if e['title'] == title][0]['id']
+
+def test_attendance_analytics(client, headers):
+    event_id = add_event(client, headers)
+    # Monday 2025-01-06 starts the second week
+    record(client, headers, event_id, 10, '2025-01-05')
+    record(client, headers, event_id, 20, '2025-01-12')
+    record(client, headers, event_id, 40, '2025-01-19T10:00:00')
+
+    result = client.get('/attendance/analytics?window=2', headers=headers).get_json()
+    assert result['weeks'] == ['2024-12-30', '2025-01-06', '2025-01-13']
+    assert result['window'] == 2
+    branch, = result['branches']
+    assert branch['weekly_totals'] == [10.0, 20.0, 40.0]
+    assert branch['rolling_average'] == [10.0, 15.0, 30.0]
+    assert branch['growth_rate'] == [None, 1.0, 1.0]
+    assert branch['events'] == [{'event_id': event_id, 'title': 'Service', 'sessions': 3, 'total_attendance': 70.0}]
+
+    assert client.get('/attendance/analytics?window=2&weeks=1', headers=headers).get_json()['weeks'] == ['2025-01-13']
+    assert client.get('/attendance/analytics?window=0', headers=headers).status_code == 400
+
+def test_attendance_analytics_without_rows(client, headers):
+    assert client.get('/attendance/analytics', headers=headers).get_json() == {'weeks': [], 'window': 4, 'branches': []}
+
+def test_attendance_analytics_skips_rows_without_a_date(client, headers):
+    event_id = add_event(client, headers)
+    record(client, headers, event_id, 10, 'soon')
+    response = client.get('/attendance/analytics', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['branches'] == []
+
+    record(client, headers, event_id, 12, '2025-01-05')
+    record(client, headers, event_id, 7, '2025-13-01')
+    branch, = client.get('/attendance/analytics', headers=headers).get_json()['branches']
+    assert branch['weekly_totals'] == [12.0]
+    assert branch['events'][0]['sessions'] == 1
+
+def test_attendance_analytics_cache(client, app, headers):
+    event_id = add_event(client, headers)
+    record(client, headers, event_id, 10, '2025-01-05')
+    assert client.get('/attendance/analytics', headers=headers).get_json()['branches'][0]['weekly_totals'] == [10.0]
+    assert len(app.extensions['church_api'].attendance_analytics_cache) == 1
+
+    # A POST clears the cache
+    record(client, headers, event_id, 5, '2025-01-05')
+    assert len(app.extensions['church_api'].attendance_analytics_cache) == 0
+    assert client.get('/attendance/analytics', headers=headers).get_json()['branches'][0]['weekly_totals'] == [15.0]
+
+    # A row added by another process changes the latest id in the key
+    execute(app, "INSERT INTO attendance (event_id, member_count, date, church_id) VALUES (?, 1, '2025-01-05', 1)", (event_id,))
+    assert client.get('/attendance/analytics', headers=headers).get_json()['branches'][0]['weekly_totals'] == [16.0]
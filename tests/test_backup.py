@@ -0,0 +1,110 @@
+import sqlite3
+from datetime import timedelta
+
+import pytest
+
+import backup
+import database
+
+def make_database(path):
+    conn = sqlite3.connect(path)
+    database.init_db(conn)
+    conn.close()
+
+def generation(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT value FROM db_meta WHERE key = 'generation'").fetchone()[0]
+    finally:
+        conn.close()
+
+def add_church(path, name):
+    conn = sqlite3.connect(path)
+    conn.execute('INSERT INTO churches (name) VALUES (?)', (name,))
+    conn.commit()
+    conn.close()
+
+def church_names(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute('SELECT name FROM churches ORDER BY id')]
+    finally:
+        conn.close()
+
+def test_restore_round_trip_rotates_the_generation(tmp_path):
+    path = str(tmp_path / 'church.db')
+    backup_dir = str(tmp_path / 'backups')
+    make_database(path)
+    add_church(path, 'Main')
+    before = generation(path)
+
+    snapshot = backup.create_backup(path, backup_dir, sleep=0)
+    add_church(path, 'Late')
+
+    assert backup.restore_backup(path, backup_dir=backup_dir, sleep=0) == snapshot
+    assert church_names(path) == ['Main']
+    assert generation(path) != before
+
+def test_restore_command(tmp_path):
+    path = str(tmp_path / 'church.db')
+    backup_dir = str(tmp_path / 'backups')
+    make_database(path)
+    before = generation(path)
+
+    assert backup.main(['--dir', backup_dir, 'create', '--database', path]) == 0
+    assert backup.main(['--dir', backup_dir, 'restore', '--database', path]) == 0
+    assert generation(path) != before
+
+def test_list_backups(tmp_path):
+    path = str(tmp_path / 'church.db')
+    backup_dir = str(tmp_path / 'backups')
+    assert backup.list_backups(backup_dir) == []
+    make_database(path)
+    first = backup.create_backup(path, backup_dir, sleep=0)
+    second = backup.create_backup(path, backup_dir, sleep=0)
+    # Unfinished copies and other files are not snapshots
+    open(str(tmp_path / 'backups' / 'backup-x.db.partial'), 'w').close()
+    open(str(tmp_path / 'backups' / 'notes.txt'), 'w').close()
+
+    snapshots = backup.list_backups(backup_dir)
+    assert [snapshot_path for taken_at, snapshot_path in snapshots] == [first, second]
+    assert snapshots[0][0] < snapshots[1][0]
+
+def test_restore_at_picks_the_newest_snapshot_before(tmp_path):
+    path = str(tmp_path / 'church.db')
+    backup_dir = str(tmp_path / 'backups')
+    make_database(path)
+    add_church(path, 'Main')
+    first = backup.create_backup(path, backup_dir, sleep=0)
+    add_church(path, 'North')
+    second = backup.create_backup(path, backup_dir, sleep=0)
+    add_church(path, 'South')
+    (first_at, _), (second_at, _) = backup.list_backups(backup_dir)
+
+    assert backup.restore_backup(path, at=first_at, backup_dir=backup_dir, sleep=0) == first
+    assert church_names(path) == ['Main']
+    assert backup.restore_backup(path, at=second_at - timedelta(microseconds=1), backup_dir=backup_dir, sleep=0) == first
+    assert backup.restore_backup(path, backup_dir=backup_dir, sleep=0) == second
+    assert church_names(path) == ['Main', 'North']
+
+    with pytest.raises(LookupError):
+        backup.restore_backup(path, at=first_at - timedelta(seconds=1), backup_dir=backup_dir, sleep=0)
+
+def test_restore_command_at(tmp_path, capsys):
+    path = str(tmp_path / 'church.db')
+    backup_dir = str(tmp_path / 'backups')
+    make_database(path)
+    add_church(path, 'Main')
+    backup.create_backup(path, backup_dir, sleep=0)
+    add_church(path, 'North')
+    (taken_at, snapshot), = backup.list_backups(backup_dir)
+
+    # Times without an offset are UTC
+    at = taken_at.replace(tzinfo=None).isoformat()
+    assert backup.main(['--dir', backup_dir, 'restore', '--database', path, '--at', at]) == 0
+    assert church_names(path) == ['Main']
+    assert backup.main(['--dir', backup_dir, 'restore', '--database', path, '--at', '2000-01-01T00:00:00']) == 1
+    assert 'No backup' in capsys.readouterr().err
+
+    assert backup.main(['--dir', backup_dir, 'list']) == 0
+    assert snapshot in capsys.readouterr().out
@@ -0,0 +1,73 @@
+from flask import request
+
+from app import create_app, dispose_app
+
+from conftest import execute, register
+
+def batch(client, headers, *requests):
+    response = client.post('/batch', json={'requests': list(requests)}, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()['responses']
+
+def test_batch(client, headers):
+    client.post('/members', json={'name': 'Ada'}, headers=headers)
+    branch = client.post('/churches', json={'name': 'North'}, headers=headers).get_json()['church_id']
+    for i in range(3):
+        client.post('/messages', json={'receiver_church_id': branch, 'message_content': 'm%d' % i}, headers=headers)
+
+    members, messages = batch(client, headers, {'path': '/members'}, {'path': '/messages/%d?limit=2' % branch})
+    assert members['status'] == 200 and [m['name'] for m in members['body']] == ['Ada']
+    assert [m['message_content'] for m in messages['body']] == ['m1', 'm2']
+    assert messages['headers'] == {'X-Has-More': 'true'}
+
+def test_batch_rejects_writes_nesting_and_streams(client, headers):
+    write, nested, statements, missing, no_path = batch(
+        client, headers,
+        {'path': '/members', 'method': 'POST'},
+        {'path': '/batch'},
+        {'path': '/donations/statements?year=2025'},
+        {'path': '/nowhere'},
+        {})
+    assert write['status'] == 405
+    assert nested['status'] == 400
+    assert statements['status'] == 400 and 'JSON' in statements['body']['error']
+    assert missing['status'] == 404 and missing['body'] == {'error': '404 NOT FOUND'}
+    assert no_path['status'] == 400
+    assert client.get('/members', headers=headers).get_json() == []
+
+def test_batch_limits(client, headers):
+    assert client.post('/batch', json={'requests': []}, headers=headers).status_code == 400
+    assert client.post('/batch', json={'requests': [{'path': '/members'}] * 21}, headers=headers).status_code == 400
+
+def test_batch_runs_with_the_callers_credentials(client, headers):
+    other = register(client, name='Other', email='other@example.com')
+    client.post('/members', json={'name': 'Elsewhere'}, headers=other)
+
+    assert client.post('/batch', json={'requests': [{'path': '/members'}]}).status_code == 401
+    mine, theirs = batch(client, headers, {'path': '/members'}, {'path': '/members?church_id=%s' % other['Associated-Church-Id']})
+    assert mine['body'] == []
+    assert theirs['status'] == 403
+
+def test_batch_reads_one_snapshot(tmp_path):
+    # A file database, so a write from another connection doesn't wait for the batch
+    app = create_app({'DATABASE': str(tmp_path / 'church.db'), 'PASSWORD_HASH_WORKERS': 0, 'JOB_DIR': str(tmp_path / 'jobs')})
+    try:
+        client = app.test_client()
+        headers = register(client)
+        dispatch = app.full_dispatch_request
+        written = []
+
+        def write_after_first_read():
+            # Also dispatches the /batch request itself, which runs first
+            response = dispatch()
+            if request.path != '/batch' and not written:
+                written.append(execute(app, "INSERT INTO members (name, church_id) VALUES ('Late', ?)", (headers['Associated-Church-Id'],)))
+            return response
+
+        app.full_dispatch_request = write_after_first_read
+        first, second = batch(client, headers, {'path': '/members'}, {'path': '/members'})
+        del app.full_dispatch_request
+        assert written and first['body'] == second['body'] == []
+        assert [m['name'] for m in client.get('/members', headers=headers).get_json()] == ['Late']
+    finally:
+        dispose_app(app)
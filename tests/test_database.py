@@ -0,0 +1,34 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import database
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database.py')
+
+def tables(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        conn.close()
+
+def test_script_initializes_the_configured_database(tmp_path):
+    configured = str(tmp_path / 'configured.db')
+    env = dict(os.environ, DATABASE=configured)
+    subprocess.run([sys.executable, SCRIPT], cwd=str(tmp_path), env=env, check=True, capture_output=True)
+    assert {'churches', 'donations', 'db_meta'} <= tables(configured)
+    assert not os.path.exists(str(tmp_path / 'database.db'))
+
+    given = str(tmp_path / 'given.db')
+    subprocess.run([sys.executable, SCRIPT, given], cwd=str(tmp_path), env=env, check=True, capture_output=True)
+    assert 'churches' in tables(given)
+
+def test_init_db_path(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE', str(tmp_path / 'env.db'))
+    assert database.default_path() == str(tmp_path / 'env.db')
+    database.init_db()
+    assert 'churches' in tables(str(tmp_path / 'env.db'))
+    database.init_db(path='file:%s' % (tmp_path / 'uri.db'))
+    assert 'churches' in tables(str(tmp_path / 'uri.db'))
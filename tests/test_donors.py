@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+import sqlite3
+
+import database
+
+from conftest import register
+
+def test_normalize_donor_name():
+    assert database.normalize_donor_name('  John   Smith ') == 'john smith'
+    assert database.normalize_donor_name('JOHN\tsmith') == database.normalize_donor_name('john smith')
+    assert database.normalize_donor_name('Straße') == database.normalize_donor_name('STRASSE')
+
+def test_upgrade_backfills_donors():
+    # A database from before the donors table
+    conn = sqlite3.connect(':memory:')
+    database.init_db(conn)
+    conn.execute('DROP TABLE donations')
+    conn.execute('''
+        CREATE TABLE donations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            amount REAL NOT NULL,
+            donor_name TEXT,
+            date TEXT NOT NULL,
+            type TEXT,
+            church_id INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT INTO churches (name) VALUES ('Main')")
+    conn.executemany("INSERT INTO donations (amount, donor_name, date, church_id) VALUES (1, ?, '2025-01-05', 1)",
+                     [('John Smith',), ('john  smith',), ('Mary',), (None,), ('  ',)])
+    conn.commit()
+
+    database.upgrade_db(conn)
+    rows = conn.execute('SELECT d.donor_name, dn.name FROM donations d LEFT JOIN donors dn ON dn.id = d.donor_id ORDER BY d.id').fetchall()
+    assert rows == [('John Smith', 'John Smith'), ('john  smith', 'John Smith'), ('Mary', 'Mary'), (None, None), ('  ', None)]
+    assert conn.execute('SELECT COUNT(*) FROM donors').fetchone()[0] == 2
+    conn.close()
+
+def donate(client, headers, amount, donor_name, date, church_id=None):
+    data = {'amount': amount, 'donor_name': donor_name, 'date': date, 'type': 'tithe'}
+    if church_id is not None:
+        data['church_id'] = church_id
+    assert client.post('/donations', json=data, headers=headers).status_code == 201
+
+def test_statements(client, headers):
+    branch = client.post('/churches', json={'name': 'North'}, headers=headers).get_json()['church_id']
+    donate(client, headers, 100, 'John Smith', '2025-01-05')
+    donate(client, headers, 50, 'john  SMITH', '2025-12-31T23:00:00', branch)
+    donate(client, headers, 20, 'Ann Lee', '2025-06-01')
+    donate(client, headers, 5, None, '2025-06-01')
+    # Outside the year
+    donate(client, headers, 1000, 'John Smith', '2024-12-31')
+    donate(client, headers, 1000, 'Ann Lee', '2026-01-01')
+
+    response = client.get('/donations/statements?year=2025', headers=headers)
+    assert response.status_code == 200 and response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=giving-statements-2025.csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(r['donor_name'], r['donation_count'], float(r['total_amount'])) for r in rows] == [('Ann Lee', '1', 20.0), ('John Smith', '2', 150.0)]
+    assert rows[1]['first_donation_date'] == '2025-01-05' and rows[1]['last_donation_date'] == '2025-12-31T23:00:00'
+
+    response = client.get('/donations/statements?year=2025&format=ndjson', headers=headers)
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(line['donor_name'], line['year'], line['total_amount']) for line in lines] == [('Ann Lee', 2025, 20.0), ('John Smith', 2025, 150.0)]
+
+    # One branch of the hierarchy
+    response = client.get('/donations/statements?year=2025&format=ndjson&church_id=%d' % branch, headers=headers)
+    assert [json.loads(line)['total_amount'] for line in response.get_data(as_text=True).splitlines()] == [50.0]
+
+def test_statements_scope_and_parameters(client, headers):
+    other = register(client, name='Other', email='other@example.com')
+    donate(client, other, 10, 'Elsewhere', '2025-03-01')
+
+    response = client.get('/donations/statements?year=2025', headers=headers)
+    assert response.get_data(as_text=True).splitlines()[1:] == []
+    assert client.get('/donations/statements?year=2025&church_id=%s' % other['Associated-Church-Id'], headers=headers).status_code == 403
+    assert client.get('/donations/statements', headers=headers).status_code == 400
+    assert client.get('/donations/statements?year=2025&format=xml', headers=headers).status_code == 400
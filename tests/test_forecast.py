@@ -0,0 +1,54 @@
+from conftest import execute, register
+
+URL = '/finances/forecast?as_of=2025-03-02&window=4&horizon=2&weeks=4'
+
+def donate(app, amount, date, church_id=1):
+    execute(app, "INSERT INTO donations (amount, donor_name, date, type, church_id) VALUES (?, 'D', ?, 'cash', ?)", (amount, date, church_id))
+
+def spend(app, amount, date, project_id=None, church_id=1):
+    execute(app, "INSERT INTO expenses (description, amount, date, project_id, church_id) VALUES ('E', ?, ?, ?, ?)", (amount, date, project_id, church_id))
+
+def test_forecast(client, app, headers):
+    project_id = execute(app, "INSERT INTO projects (name, budget, church_id) VALUES ('Roof', 1000, 1)")
+    # The four weeks up to and including as_of (a Sunday)
+    for date in ('2025-02-09', '2025-02-16', '2025-02-23', '2025-03-02'):
+        donate(app, 100, date)
+        spend(app, 25, date, project_id)
+    # After as_of: not part of the forecast
+    donate(app, 5000, '2025-03-03')
+
+    forecast = client.get(URL, headers=headers).get_json()
+    assert forecast['weeks'] == ['2025-02-09', '2025-02-16', '2025-02-23', '2025-03-02']
+    church, = forecast['churches']
+    assert church['balance'] == 300.0
+    assert church['weekly_donations'] == 100.0 and church['weekly_expenses'] == 25.0
+    assert church['projected_balance'] == 450.0
+    assert church['donations_moving_average'][-1] == 100.0
+    project, = forecast['projects']
+    assert project['spent'] == 100.0 and project['remaining'] == 900.0
+    assert project['weekly_burn_rate'] == 25.0 and project['weeks_left'] == 36.0
+
+def test_forecast_skips_rows_without_a_date(client, app, headers):
+    donate(app, 100, '2025-03-01')
+    # Sorted before as_of, so they pass the date filter
+    donate(app, 50, '2025-02-30')
+    donate(app, 50, '')
+    spend(app, 20, '2025-00-10')
+
+    response = client.get(URL, headers=headers)
+    assert response.status_code == 200
+    church, = response.get_json()['churches']
+    assert church['balance'] == 100.0
+
+def test_forecast_parameters(client, headers):
+    assert client.get('/finances/forecast?window=0', headers=headers).status_code == 400
+    assert client.get('/finances/forecast?horizon=x', headers=headers).status_code == 400
+    assert client.get('/finances/forecast?as_of=2025-13-01', headers=headers).status_code == 400
+    # Series are at least window weeks long, so it is bounded
+    assert client.get('/finances/forecast?window=2000000', headers=headers).status_code == 400
+    assert client.get('/finances/forecast?horizon=105', headers=headers).status_code == 400
+    assert client.get('/finances/forecast?window=104&horizon=104&weeks=104', headers=headers).status_code == 200
+
+def test_forecast_scope(client, headers):
+    other = register(client, name='Other', email='other@example.com')
+    assert client.get(URL + '&church_id=%s' % other['Associated-Church-Id'], headers=headers).status_code == 403
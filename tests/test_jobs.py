@@ -0,0 +1,53 @@
+import os
+import time
+
+import database
+from app import _get_jobs, connect_db, create_app, dispose_app
+
+from conftest import execute, register
+
+def run_job(client, headers):
+    # Submit a finance_totals job and wait for its result
+    response = client.post('/jobs', json={'kind': 'finance_totals'}, headers=headers)
+    job = response.get_json()
+    deadline = time.time() + 10
+    while job['status'] in ('queued', 'running') and time.time() < deadline:
+        time.sleep(0.01)
+        job = client.get(response.headers['Location'], headers=headers).get_json()
+    assert job['status'] == 'done', job
+    return job
+
+def test_databases_sharing_a_job_dir_get_their_own_results(tmp_path):
+    apps = [create_app({'DATABASE': ':memory:', 'PASSWORD_HASH_WORKERS': 0, 'JOB_DIR': str(tmp_path / 'jobs')}) for _ in range(2)]
+    try:
+        totals = []
+        for app, amount in zip(apps, (100, 999)):
+            client = app.test_client()
+            headers = register(client)
+            # Same churches and change_log position in both databases, different amounts
+            execute(app, "INSERT INTO donations (amount, donor_name, date, type, church_id) VALUES (?, 'D', '2025-01-05', 'cash', 1)", (amount,))
+            job = run_job(client, headers)
+            assert not job['cached']
+            totals.append(job['result']['total_balance'])
+        assert totals == [100, 999]
+    finally:
+        for app in apps:
+            dispose_app(app)
+
+def test_new_generation_misses_the_cache(client, app, headers):
+    assert not run_job(client, headers)['cached']
+    assert run_job(client, headers)['cached']
+
+    conn = connect_db(app=app)
+    database.new_generation(conn)
+    conn.close()
+    assert not run_job(client, headers)['cached']
+
+def test_job_dir_defaults_next_to_the_database(tmp_path):
+    path = str(tmp_path / 'church.db')
+    app = create_app({'DATABASE': path, 'PASSWORD_HASH_WORKERS': 0, 'JOB_DIR': None})
+    try:
+        with app.app_context():
+            assert _get_jobs(app).jobs_dir == os.path.join(path + '-jobs', 'jobs')
+    finally:
+        dispose_app(app)
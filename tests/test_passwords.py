@@ -0,0 +1,38 @@
+import admission
+import passwords
+from app import connect_db
+
+def stored_hash(app, email='main@example.com'):
+    conn = connect_db(app=app)
+    try:
+        return conn.execute('SELECT password FROM users WHERE email = ?', (email,)).fetchone()[0]
+    finally:
+        conn.close()
+
+def login(client, password='secret'):
+    return client.post('/login', json={'email': 'main@example.com', 'password': password})
+
+def test_login_upgrades_the_hash(client, app, headers, monkeypatch):
+    original = stored_hash(app)
+    assert not passwords.needs_rehash(original)
+    assert login(client).status_code == 200
+    assert stored_hash(app) == original
+
+    monkeypatch.setattr(passwords, 'HASH_METHOD', 'pbkdf2:sha256:2000')
+    admitted = admission.controller_for(app).metrics()['admitted']
+    assert login(client).status_code == 200
+    upgraded = stored_hash(app)
+    assert upgraded.startswith('pbkdf2:sha256:2000$') and not passwords.needs_rehash(upgraded)
+    # The update went through the admission controller like any other write
+    assert admission.controller_for(app).metrics()['admitted'] == admitted + 1
+
+    monkeypatch.setattr(passwords, 'SALT_LENGTH', 24)
+    assert login(client).status_code == 200
+    assert len(stored_hash(app).split('$')[1]) == 24
+    assert login(client).status_code == 200
+
+def test_failed_login_keeps_the_hash(client, app, headers, monkeypatch):
+    original = stored_hash(app)
+    monkeypatch.setattr(passwords, 'HASH_METHOD', 'pbkdf2:sha256:2000')
+    assert login(client, 'wrong').status_code == 401
+    assert stored_hash(app) == original
@@ -0,0 +1,57 @@
+from conftest import execute, register
+
+def add_project(client, headers, name, budget, church_id=None):
+    data = {'name': name, 'budget': budget}
+    if church_id is not None:
+        data['church_id'] = church_id
+    response = client.post('/projects', json=data, headers=headers)
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+def add_expense(client, headers, amount, date, project_id):
+    response = client.post('/expenses', json={'description': 'E', 'amount': amount, 'date': date, 'project_id': project_id}, headers=headers)
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+def spending(client, headers, query=''):
+    projects = client.get('/projects?include_spending=true' + query, headers=headers).get_json()
+    return {p['name']: (p['spent'], p['remaining'], p['expense_count'], p['last_expense_date']) for p in projects}
+
+def test_project_spending(client, app, headers):
+    roof = add_project(client, headers, 'Roof', 1000)
+    organ = add_project(client, headers, 'Organ', 500)
+    add_project(client, headers, 'Garden', 200)
+    add_expense(client, headers, 100, '2025-01-05', roof)
+    moved = add_expense(client, headers, 40, '2025-02-01', roof)
+    deleted = add_expense(client, headers, 60, '2025-03-01', organ)
+    # Not part of any project
+    add_expense(client, headers, 999, '2025-01-05', None)
+
+    assert spending(client, headers) == {
+        'Roof': (140.0, 860.0, 2, '2025-02-01'),
+        'Organ': (60.0, 440.0, 1, '2025-03-01'),
+        'Garden': (0.0, 200.0, 0, None)
+    }
+
+    execute(app, "UPDATE expenses SET project_id = ? WHERE id = ?", (organ, moved))
+    execute(app, "DELETE FROM expenses WHERE id = ?", (deleted,))
+    assert spending(client, headers) == {
+        'Roof': (100.0, 900.0, 1, '2025-01-05'),
+        'Organ': (40.0, 460.0, 1, '2025-02-01'),
+        'Garden': (0.0, 200.0, 0, None)
+    }
+
+    # Without the flag the projects are listed as stored
+    assert sorted(p['name'] for p in client.get('/projects', headers=headers).get_json()) == ['Garden', 'Organ', 'Roof']
+    assert 'spent' not in client.get('/projects', headers=headers).get_json()[0]
+
+def test_project_spending_scope(client, headers):
+    branch = client.post('/churches', json={'name': 'North'}, headers=headers).get_json()['church_id']
+    add_project(client, headers, 'Roof', 1000)
+    add_project(client, headers, 'Hall', 300, branch)
+    assert set(spending(client, headers)) == {'Roof', 'Hall'}
+    assert set(spending(client, headers, '&church_id=%d' % branch)) == {'Hall'}
+
+    other = register(client, name='Other', email='other@example.com')
+    add_project(client, other, 'Elsewhere', 50)
+    assert set(spending(client, headers)) == {'Roof', 'Hall'}